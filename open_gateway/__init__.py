@@ -18,6 +18,24 @@ config = {
     "CONFIG_SAMPLES_PER_PACKET": 1,
     "CONVERT_TO_INT16": True,
     "SCALING_FACTOR": 1,
+    "SAMPLE_BUFFER": False,
+    "BACKPRESSURE_POLICY": "drop-oldest",
+    "RECORD_BACKPRESSURE_POLICY": "spill",
+    "BACKPRESSURE_TIMEOUT": 1.0,
+    "OVERFLOW_BUFFER_SIZE_MB": 0,
+    "OVERFLOW_BUFFER_PATH": None,
+    "SHARED_MEMORY_NAME": None,
+    "BUFFER_LATENCY_MS": None,
+    "BUFFER_HISTORY_SECONDS": None,
+    "INFERENCE_QUEUE_SIZE": 64,
+    "SML_LIBRARY_PATHS": None,
+    "SML_MODEL_INDEXES": [0],
+    "SML_INSTRUMENT": False,
+    "SML_CAPTURE_FEATURES": False,
+    "FUSION_MODE": "interleave",
+    "FUSION_SAMPLE_RATE": None,
+    "FUSION_SILENT_SOURCE_POLICY": "stall",
+    "FUSION_SILENT_SOURCE_TIMEOUT": 1.0,
 }
 
 
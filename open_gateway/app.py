@@ -30,6 +30,7 @@ from open_gateway.forms import (
     CameraForm,
 )
 from open_gateway.sources import get_source
+from open_gateway.sources.utils.sml_emulator import is_emulator_path
 from open_gateway.errors import errors
 from open_gateway.video_sources import get_video_source, get_video_source_list
 import zipfile
@@ -75,6 +76,11 @@ app.config["GAME_MODE_ASSETS"] = {}
 wsgi_app = app.wsgi_app
 
 
+def parse_flag(value):
+    """True for the true/yes/1 values of an on/off switch from a form or the command line"""
+    return str(value).strip().lower() in ("true", "yes", "1", "on")
+
+
 def cache_config(config):
     tmp = {
         "CONFIG_SAMPLE_RATE": config["CONFIG_SAMPLE_RATE"],
@@ -86,6 +92,8 @@ def cache_config(config):
         "DATA_TYPE": config["DATA_TYPE"],
         "BAUD_RATE": config["BAUD_RATE"],
         "SAMPLE_RATE": config["SAMPLE_RATE"],
+        "SML_LIBRARY_PATHS": config["SML_LIBRARY_PATHS"],
+        "SML_MODEL_INDEXES": config["SML_MODEL_INDEXES"],
     }
     json.dump(tmp, open(os.path.join(basedir, ".config.cache"), "w"))
 
@@ -138,10 +146,16 @@ def parse_current_config():
     ret["baud_rate"] = app.config["BAUD_RATE"]
     ret["mode"] = app.config["MODE"].lower()
     ret["recording"] = get_recording()
+    ret["capture_features"] = app.config["SML_CAPTURE_FEATURES"]
+    ret["fusion_mode"] = app.config["FUSION_MODE"]
+    ret["silent_source_policy"] = app.config["FUSION_SILENT_SOURCE_POLICY"]
     ret["data_type"] = (
         app.config["DATA_TYPE"] if not app.config["CONVERT_TO_INT16"] else "int16"
     )
 
+    if app.config["DEVICE_SOURCE"]:
+        ret["buffer_geometry"] = app.config["DEVICE_SOURCE"].get_buffer_geometry()
+
     if app.config["CONFIG_COLUMNS"]:
         ret["column_location"] = app.config["CONFIG_COLUMNS"]
     else:
@@ -248,6 +262,19 @@ def config():
             app.config["SAMPLE_RATE"] = None
             app.config["CONFIG_SAMPLE_RATE"] = None
 
+        if form.data.get("capture_features", None) is not None:
+            app.config["SML_CAPTURE_FEATURES"] = parse_flag(
+                form.data["capture_features"]
+            )
+
+        if form.data.get("fusion_mode", None):
+            app.config["FUSION_MODE"] = form.data["fusion_mode"]
+
+        if form.data.get("silent_source_policy", None):
+            app.config["FUSION_SILENT_SOURCE_POLICY"] = form.data[
+                "silent_source_policy"
+            ]
+
         source = get_source(
             app.config,
             data_source=form.data["source"].upper(),
@@ -288,6 +315,71 @@ def stream():
     )
 
 
+@app.route("/features")
+def stream_features():
+    """Feature vector, output tensor and classification of every recognized segment"""
+
+    source = app.config.get("DEVICE_SOURCE", None)
+
+    if source is None:
+        return make_response(
+            jsonify(detail="Must Connect to device before starting stream"), 400
+        )
+
+    if not getattr(source, "capture_features", False) or not hasattr(
+        source, "read_feature_data"
+    ):
+        return make_response(
+            jsonify(detail="Feature capture is not enabled for this source"), 400
+        )
+
+    return Response(
+        stream_with_context(source.read_feature_data()),
+        mimetype="application/x-ndjson",
+    )
+
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Buffer and consumer statistics of the connected data source"""
+
+    if app.config.get("DEVICE_SOURCE", None) is None:
+        return make_response(
+            jsonify(detail="Must Connect to device before requesting stats"), 400
+        )
+
+    return Response(
+        dumps(app.config["DEVICE_SOURCE"].get_stats()), mimetype="application/json"
+    )
+
+
+@app.route("/snapshot", methods=["GET"])
+def snapshot():
+    """The last N seconds of the connected stream as a single binary blob"""
+
+    source = app.config.get("DEVICE_SOURCE", None)
+
+    if source is None:
+        return make_response(
+            jsonify(detail="Must Connect to device before requesting a snapshot"), 400
+        )
+
+    if getattr(source, "buffer", None) is None:
+        return make_response(
+            jsonify(detail="Snapshots are not available for this source"), 400
+        )
+
+    seconds = request.args.get("seconds", 10, type=float)
+    sample_index, data = source.get_snapshot(seconds)
+
+    response = make_response(data)
+    response.mimetype = "application/octet-stream"
+    response.headers["X-Sample-Index"] = str(sample_index)
+    response.headers["X-Data-Width"] = str(source.data_width)
+
+    return response
+
+
 @app.route("/game-results")
 def stream_model_results():
     if app.config.get("DEVICE_SOURCE", None) is None:
@@ -328,6 +420,58 @@ def config_model_json():
     return Response(dumps(app.config["MODEL_JSON"]), mimetype="application/json")
 
 
+@app.route("/knowledge-pack", methods=["GET", "POST"])
+def knowledge_pack():
+    """Hot swap the running knowledge pack, post {"sml_library_path": <folder>}"""
+
+    source = app.config.get("DEVICE_SOURCE", None)
+
+    if source is None or not hasattr(source, "swap_knowledge_pack"):
+        return make_response(
+            jsonify(detail="Must Connect to a device running a knowledge pack"), 400
+        )
+
+    if request.method == "POST":
+        payload = request.get_json(silent=True)
+
+        if not isinstance(payload, dict) or not isinstance(
+            payload.get("sml_library_path", None), str
+        ):
+            return make_response(
+                jsonify(detail="Must post a json object with a sml_library_path"), 400
+            )
+
+        if payload.get("name", None) is not None and not isinstance(
+            payload["name"], str
+        ):
+            return make_response(jsonify(detail="name must be a string"), 400)
+
+        sml_library_path = payload["sml_library_path"]
+        library = "libsensiml.dll" if os.name == "nt" else "libsensiml.so"
+
+        if not sml_library_path or not (
+            is_emulator_path(sml_library_path)
+            or os.path.exists(os.path.join(sml_library_path, library))
+        ):
+            return make_response(
+                jsonify(detail="{} not found in {}".format(library, sml_library_path)),
+                400,
+            )
+
+        try:
+            source.swap_knowledge_pack(sml_library_path, name=payload.get("name", None))
+        except Exception as e:
+            return make_response(jsonify(detail=str(e)), 400)
+
+        app.config["SML_LIBRARY_PATH"] = source.sml_library_path
+        app.config["RUN_SML_MODEL"] = True
+
+    return Response(
+        dumps([worker.get_stats() for worker in source.inference_workers]),
+        mimetype="application/json",
+    )
+
+
 @app.route("/config-class-map-images-json", methods=["POST"])
 def config_class_map_images():
     """Post an image class map to use when showing classification results"""
@@ -737,7 +881,11 @@ python app.py -u <host> -p <port> -s <path-to-libsensiml.so-folder> -m <path-to-
 
 -u --host (str) : select the host address for the gateway to launch on
 -p --port (int) : select the port address for the gateway to launch on
--s --sml_library_path (str): set a path a knowledgepack libsensiml.so in order to run the model against the live streaming gateway data
+-s --sml_library_path (str): set a path a knowledgepack libsensiml.so in order to run the model against the live streaming gateway data, or emulator:<options> to run the pure python emulator. Repeat it to run several knowledge packs
+--capture_features (bool): capture the feature vector and output tensor of every classification for the /features stream
+--fusion_mode (str): how sources listed together in the device id are fused, interleave (same sample rate) or resample
+--silent_source_policy (str): what fused streams do when a source goes silent, stall or gap-fill
+-n --model_indexes (str): comma separated model indexes to run in every knowledge pack, defaults to 0
 -m --model_json_path (str): set to the path of them model.json from the knowledgepack and this will use the class_map described in the model json file
 -i --class_map_images_json_path (str): set a path of json file with images for the class_map, the recognition mode will use them to represent events result
 -c --connect (bool): Connect automatically to the last used connection on launch
@@ -756,17 +904,21 @@ python app.py -u <host> -p <port> -s <path-to-libsensiml.so-folder> -m <path-to-
     try:
         opts, args = getopt.getopt(
             sys.argv[1:],
-            "hu:p:s:c:f:m:i:b:z:g:v",
+            "hu:p:s:c:f:m:i:b:z:g:vn:",
             [
                 "help",
                 "host",
                 "port",
-                "sml_library_path",
                 "connect",
                 "scaling_factor",
                 "class_map_images_json_path",
                 "hide_ui",
                 "game_json" "convert_to_in16",
+                "sml_library_path=",
+                "model_indexes=",
+                "capture_features=",
+                "fusion_mode=",
+                "silent_source_policy=",
             ],
         )
     except getopt.GetoptError:
@@ -778,6 +930,7 @@ python app.py -u <host> -p <port> -s <path-to-libsensiml.so-folder> -m <path-to-
         app.config.update(json.load(open(os.path.join(basedir, ".config.cache"), "r")))
 
     HIDE_UI = False
+    sml_library_paths = []
     for opt, arg in opts:
         print(opt, arg)
         if opt in ("-z", "--hide_ui"):
@@ -791,8 +944,14 @@ python app.py -u <host> -p <port> -s <path-to-libsensiml.so-folder> -m <path-to-
             print(opt)
             PORT = int(arg)
         elif opt in ("-s", "--sml_library_path"):
-            app.config["SML_LIBRARY_PATH"] = arg
-            if os.name == "nt":
+            # repeat -s to run several knowledge packs side by side
+            sml_library_paths.append(arg)
+            app.config["SML_LIBRARY_PATH"] = sml_library_paths[0]
+            app.config["SML_LIBRARY_PATHS"] = list(sml_library_paths)
+            if is_emulator_path(arg):
+                # the emulator has no library file to look for
+                app.config["RUN_SML_MODEL"] = True
+            elif os.name == "nt":
                 app.config["RUN_SML_MODEL"] = (
                     True
                     if os.path.exists(os.path.join(arg, "libsensiml.dll"))
@@ -808,7 +967,15 @@ python app.py -u <host> -p <port> -s <path-to-libsensiml.so-folder> -m <path-to-
                 print("libsensiml not found in {}".format(arg))
                 raise Exception("libsensiml not found in {}".format(arg))
             else:
-                print("Loaded model at ", app.config["SML_LIBRARY_PATH"])
+                print("Loaded model at ", arg)
+        elif opt == "--capture_features":
+            app.config["SML_CAPTURE_FEATURES"] = parse_flag(arg)
+        elif opt == "--fusion_mode":
+            app.config["FUSION_MODE"] = arg
+        elif opt == "--silent_source_policy":
+            app.config["FUSION_SILENT_SOURCE_POLICY"] = arg
+        elif opt in ("-n", "--model_indexes"):
+            app.config["SML_MODEL_INDEXES"] = [int(x) for x in arg.split(",")]
         elif opt in ("-m", "--model_json_path"):
             if os.path.exists(arg):
                 app.config["MODEL_JSON"] = json.load(open(arg))
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import glob
+import time
+import getopt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from open_gateway import config as gateway_config
+from open_gateway.sources.base import map_classification, scale_to_int16
+from open_gateway.sources.utils.sml_runner import SMLRunner
+from open_gateway.sources.utils.sml_emulator import SMLEmulator, is_emulator_path
+
+RESULTS_SUFFIX = ".results.json"
+
+# each worker process loads its own copy of the knowledge pack, the library keeps
+# global state so it can not be shared between captures running at the same time
+_sml = None
+_config = None
+
+
+def _init_worker(config):
+    global _sml, _config
+
+    _config = config
+    if is_emulator_path(config["SML_LIBRARY_PATH"]):
+        _sml = SMLEmulator.from_path(config["SML_LIBRARY_PATH"])
+    else:
+        _sml = SMLRunner(config["SML_LIBRARY_PATH"])
+    _sml.init_model()
+
+
+def load_capture(filename, scaling_factor=1):
+    """Read a capture written by the recorder as a (samples, columns) int16 array"""
+
+    with open(filename, "r") as capture:
+        columns = capture.readline().strip().split(",")
+
+    data = np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+
+    return columns, scale_to_int16(data, scaling_factor)
+
+
+def run_capture(filename):
+    """Run every configured model over one capture and write its results file"""
+
+    start = time.perf_counter()
+    columns, data = load_capture(filename, _config["SCALING_FACTOR"])
+    load_time = time.perf_counter() - start
+
+    classifications = []
+
+    start = time.perf_counter()
+    for model_index in _config["SML_MODEL_INDEXES"]:
+        # start every capture from an empty model buffer
+        _sml.flush_model_buffer(model_index)
+        _sml.reset_model(model_index)
+
+        for offset, ret in _sml.run_model_batch(data, model_index):
+            classifications.append(
+                map_classification(
+                    {
+                        "ModelNumber": model_index,
+                        "Classification": ret,
+                        "SampleOffset": offset,
+                    },
+                    _config.get("MODEL_JSON"),
+                    _config.get("CLASS_MAP"),
+                )
+            )
+    run_time = time.perf_counter() - start
+
+    results = {
+        "capture": os.path.abspath(filename),
+        "columns": columns,
+        "samples": len(data),
+        "load_seconds": load_time,
+        "run_seconds": run_time,
+        "samples_per_second": len(data) / run_time if run_time else None,
+        "classifications": classifications,
+    }
+
+    if _config["SAMPLE_RATE"]:
+        results["realtime_factor"] = (
+            len(data) / float(_config["SAMPLE_RATE"]) / run_time if run_time else None
+        )
+
+    output_folder = _config["OUTPUT_FOLDER"] or os.path.dirname(filename)
+    output = os.path.join(
+        output_folder, os.path.splitext(os.path.basename(filename))[0] + RESULTS_SUFFIX
+    )
+
+    with open(output, "w") as out:
+        json.dump(results, out, indent=2)
+
+    return filename, output, len(data), run_time, len(classifications)
+
+
+def find_captures(paths):
+    captures = []
+    for path in paths:
+        if os.path.isdir(path):
+            captures.extend(sorted(glob.glob(os.path.join(path, "*.csv"))))
+        else:
+            captures.extend(sorted(glob.glob(path)))
+
+    return captures
+
+
+def run_batch(captures, config, workers=None):
+    """Spread the captures over a process pool, returns the per capture summaries"""
+
+    summaries = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(config,)
+    ) as executor:
+        futures = {
+            executor.submit(run_capture, capture): capture for capture in captures
+        }
+
+        for future in as_completed(futures):
+            try:
+                filename, output, samples, run_time, num_results = future.result()
+            except Exception as e:
+                print("Failed to process", futures[future], e)
+                continue
+
+            print(
+                "{}: {} samples, {} classifications, {:.0f} samples/s -> {}".format(
+                    filename,
+                    samples,
+                    num_results,
+                    samples / run_time if run_time else 0,
+                    output,
+                )
+            )
+            summaries.append((filename, samples, run_time, num_results))
+
+    elapsed = time.perf_counter() - start
+    total_samples = sum(summary[1] for summary in summaries)
+
+    print(
+        "Processed {} captures, {} samples in {:.2f}s ({:.0f} samples/s)".format(
+            len(summaries),
+            total_samples,
+            elapsed,
+            total_samples / elapsed if elapsed else 0,
+        )
+    )
+
+    return summaries
+
+
+def main():
+    options_string = """
+python -m open_gateway.batch -s <path-to-libsensiml.so-folder> [options] <capture.csv | folder> ...
+
+-s --sml_library_path (str): path to the knowledgepack libsensiml.so folder to run, or
+    emulator:<options> to run the pure python stand-in (see sml_emulator.py)
+-n --model_indexes (str): comma separated model indexes to run, defaults to 0
+-m --model_json_path (str): model.json from the knowledgepack used to map the class results
+-f --scaling_factor (float): number to multiple the recorded data by prior to converting to int16
+-r --sample_rate (int): sample rate of the captures, used to report the speed against real time
+-o --output (str): folder for the results files, defaults to next to each capture
+-j --jobs (int): number of worker processes, defaults to the number of cpus
+"""
+
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "hs:n:m:f:r:o:j:",
+            [
+                "help",
+                "sml_library_path=",
+                "model_indexes=",
+                "model_json_path=",
+                "scaling_factor=",
+                "sample_rate=",
+                "output=",
+                "jobs=",
+            ],
+        )
+    except getopt.GetoptError:
+        print("Invalid opt selection!")
+        print(options_string)
+        sys.exit(1)
+
+    config = {
+        "SML_LIBRARY_PATH": None,
+        "SML_MODEL_INDEXES": [0],
+        "MODEL_JSON": None,
+        "CLASS_MAP": gateway_config["CLASS_MAP"],
+        "SCALING_FACTOR": 1,
+        "SAMPLE_RATE": None,
+        "OUTPUT_FOLDER": None,
+    }
+    workers = None
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(options_string)
+            sys.exit(0)
+        elif opt in ("-s", "--sml_library_path"):
+            config["SML_LIBRARY_PATH"] = arg
+        elif opt in ("-n", "--model_indexes"):
+            config["SML_MODEL_INDEXES"] = [int(index) for index in arg.split(",")]
+        elif opt in ("-m", "--model_json_path"):
+            config["MODEL_JSON"] = json.load(open(arg))
+        elif opt in ("-f", "--scaling_factor"):
+            config["SCALING_FACTOR"] = float(arg)
+        elif opt in ("-r", "--sample_rate"):
+            config["SAMPLE_RATE"] = int(arg)
+        elif opt in ("-o", "--output"):
+            config["OUTPUT_FOLDER"] = arg
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+
+    if config["SML_LIBRARY_PATH"] is None:
+        print("A knowledgepack must be set with -s")
+        print(options_string)
+        sys.exit(1)
+
+    captures = find_captures(args)
+
+    if not captures:
+        print("No captures found")
+        sys.exit(1)
+
+    if config["OUTPUT_FOLDER"] and not os.path.exists(config["OUTPUT_FOLDER"]):
+        os.makedirs(config["OUTPUT_FOLDER"])
+
+    run_batch(captures, config, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
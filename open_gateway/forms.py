@@ -9,6 +9,13 @@ class DeviceConfigureForm(FlaskForm):
     mode = StringField("MODE", validators=[validators.input_required()])
     baud_rate = IntegerField("Baud Rate", validators=[validators.Optional()])
     sample_rate = IntegerField("Sample Rate", validators=[validators.Optional()])
+    capture_features = StringField(
+        "Capture Features", validators=[validators.Optional()]
+    )
+    fusion_mode = StringField("Fusion Mode", validators=[validators.Optional()])
+    silent_source_policy = StringField(
+        "Silent Source Policy", validators=[validators.Optional()]
+    )
     submit = SubmitField("Submit")
 
 
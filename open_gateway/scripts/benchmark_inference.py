@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import getopt
+import contextlib
+
+import numpy as np
+
+from open_gateway import config as gateway_config
+from open_gateway.sources import get_source
+from open_gateway.sources.buffers import CircularResultsBufferQueue
+from open_gateway.sources.utils.sml_emulator import (
+    EMULATOR_SEGMENT_LENGTH,
+    is_emulator_path,
+    parse_emulator_options,
+)
+
+DEFAULT_KNOWLEDGE_PACK = "emulator:segment_length=100"
+DEFAULT_DEVICE = "Test IMU 6-axis"
+DEFAULT_PACKETS = 2000
+
+
+def benchmark(sml_library_path, device_id, packets, capture_features=False):
+    """Time execute_run_sml_model over random packets of the test source.
+
+    Returns (packets, samples, classifications, seconds).
+    """
+
+    config = dict(gateway_config, LOOP=None, SML_LIBRARY_PATH=sml_library_path)
+    reader = get_source(config, "TEST", device_id, source_type="DATA_CAPTURE")
+    reader.read_config()
+
+    if capture_features:
+        reader.fbuffer = CircularResultsBufferQueue(reader._lock, buffer_size=1)
+
+    sml = reader.get_sml_model_obj(sml_library_path)
+
+    shape = (reader.source_samples_per_packet, len(reader.config_columns))
+    data = [
+        np.random.randint(-2000, 2000, size=shape, dtype=np.int16).tobytes()
+        for _ in range(16)
+    ]
+
+    classifications = 0
+    # the results are printed by execute_run_sml_model, keep the terminal out of it
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for index in range(packets):
+            classifications += len(
+                reader.execute_run_sml_model(sml, data[index % len(data)])
+            )
+        elapsed = time.perf_counter() - start
+
+    return packets, packets * shape[0], classifications, elapsed
+
+
+def check_regression(
+    sml_library_path, samples, classifications, elapsed, min_samples_per_second=None
+):
+    """Problems found in a benchmark run, an empty list when it passed.
+
+    The emulator classifies every segment_length samples, so its classification count
+    checks the batch loop, min_samples_per_second checks the throughput.
+    """
+
+    problems = []
+
+    if is_emulator_path(sml_library_path):
+        segment_length = parse_emulator_options(sml_library_path).get(
+            "segment_length", EMULATOR_SEGMENT_LENGTH
+        )
+        expected = samples // segment_length
+        if classifications != expected:
+            problems.append(
+                "expected {} classifications, got {}".format(expected, classifications)
+            )
+
+    if (
+        min_samples_per_second is not None
+        and samples / elapsed < min_samples_per_second
+    ):
+        problems.append(
+            "{:.0f} samples/s is below the minimum of {:.0f}".format(
+                samples / elapsed, min_samples_per_second
+            )
+        )
+
+    return problems
+
+
+def main():
+    options_string = """
+python -m open_gateway.scripts.benchmark_inference [options]
+
+-s --sml_library_path (str): knowledgepack folder or emulator:<options>, defaults to {}
+-d --device_id (str): test source device, defaults to {}
+-p --packets (int): number of packets to run, defaults to {}
+-f --features: capture the feature vectors of every classification
+-m --min_samples_per_second (float): exit with an error when the run is slower
+""".format(DEFAULT_KNOWLEDGE_PACK, DEFAULT_DEVICE, DEFAULT_PACKETS)
+
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "hs:d:p:fm:",
+            [
+                "help",
+                "sml_library_path=",
+                "device_id=",
+                "packets=",
+                "features",
+                "min_samples_per_second=",
+            ],
+        )
+    except getopt.GetoptError:
+        print("Invalid opt selection!")
+        print(options_string)
+        sys.exit(1)
+
+    sml_library_path = DEFAULT_KNOWLEDGE_PACK
+    device_id = DEFAULT_DEVICE
+    packets = DEFAULT_PACKETS
+    capture_features = False
+    min_samples_per_second = None
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(options_string)
+            sys.exit(0)
+        elif opt in ("-s", "--sml_library_path"):
+            sml_library_path = arg
+        elif opt in ("-d", "--device_id"):
+            device_id = arg
+        elif opt in ("-p", "--packets"):
+            packets = int(arg)
+        elif opt in ("-f", "--features"):
+            capture_features = True
+        elif opt in ("-m", "--min_samples_per_second"):
+            min_samples_per_second = float(arg)
+
+    packets, samples, classifications, elapsed = benchmark(
+        sml_library_path, device_id, packets, capture_features=capture_features
+    )
+
+    print(
+        "{}: {} packets, {} samples, {} classifications in {:.3f}s".format(
+            sml_library_path, packets, samples, classifications, elapsed
+        )
+    )
+    print(
+        "{:.0f} packets/s, {:.0f} samples/s, {:.2f} us/sample".format(
+            packets / elapsed, samples / elapsed, elapsed * 1e6 / samples
+        )
+    )
+
+    problems = check_regression(
+        sml_library_path,
+        samples,
+        classifications,
+        elapsed,
+        min_samples_per_second=min_samples_per_second,
+    )
+    for problem in problems:
+        print("Regression:", problem)
+
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
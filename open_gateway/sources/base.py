@@ -1,11 +1,20 @@
 import json
+import math
 import threading
 import struct
 import time
 import csv
 import os
 import random
+import numpy as np
 from open_gateway.sources.utils.sml_runner import SMLRunner
+from open_gateway.sources.utils.sml_emulator import SMLEmulator, is_emulator_path
+from open_gateway.sources.inference import (
+    InferencePacket,
+    InferenceWorker,
+    INFERENCE_QUEUE_SIZE,
+    stage_knowledge_pack,
+)
 from open_gateway import basedir, ensure_folder_exists
 import random
 
@@ -13,9 +22,58 @@ try:
     from open_gateway.sources.buffers import (
         CircularBufferQueue,
         CircularResultsBufferQueue,
+        PreallocatedCircularBufferQueue,
+        SharedMemoryCircularBufferQueue,
+        CircularSampleBufferQueue,
+        BufferOverrunException,
+        OVERRUN_SKIP,
+        OVERRUN_RAISE,
+        POLICY_DROP_OLDEST,
+        POLICY_SPILL,
     )
 except:
-    from open_gateway.buffers import CircularBufferQueue, CircularResultsBufferQueue
+    from open_gateway.buffers import (
+        CircularBufferQueue,
+        CircularResultsBufferQueue,
+        PreallocatedCircularBufferQueue,
+        SharedMemoryCircularBufferQueue,
+        CircularSampleBufferQueue,
+        BufferOverrunException,
+        OVERRUN_SKIP,
+        OVERRUN_RAISE,
+        POLICY_DROP_OLDEST,
+        POLICY_SPILL,
+    )
+
+# seconds a reader blocks on a buffer before re-checking that the source is still streaming
+BUFFER_WAIT_TIMEOUT = 0.5
+DEFAULT_NUM_SLOTS = 256
+# upper bound on the slots a stream consumer drains per read after a stall
+STREAM_MAX_SLOTS = 64
+INT16_MIN = -32768
+INT16_MAX = 32767
+
+
+def scale_to_int16(samples, scaling_factor=1):
+    """samples times scaling_factor as int16, values past the int16 range are pinned"""
+    scaled = np.multiply(samples, scaling_factor, dtype=np.float64)
+
+    return np.clip(scaled, INT16_MIN, INT16_MAX).astype(np.int16)
+
+
+def map_classification(result, model_json=None, class_map=None):
+    """Replace the class number of a result with its name from the model json or map"""
+    if model_json:
+        result["Classification"] = model_json["ModelDescriptions"][
+            result["ModelNumber"]
+        ]["ClassMaps"][str(result["Classification"])]
+
+    elif class_map:
+        result["Classification"] = class_map.get(
+            result["Classification"], result["Classification"]
+        )
+
+    return result
 
 
 class BaseReader(object):
@@ -32,7 +90,34 @@ class BaseReader(object):
         self.run_sml_model = config.get("RUN_SML_MODEL", False)
         self.convert_to_int16 = config.get("CONVERT_TO_INT16", False)
         self.scaling_factor = config.get("SCALING_FACTOR", 1)
+        self.use_sample_buffer = config.get("SAMPLE_BUFFER", False)
+        self.backpressure_policy = config.get("BACKPRESSURE_POLICY", POLICY_DROP_OLDEST)
+        self.record_backpressure_policy = config.get(
+            "RECORD_BACKPRESSURE_POLICY", POLICY_SPILL
+        )
+        self.backpressure_timeout = config.get("BACKPRESSURE_TIMEOUT", 1.0)
+        self.overflow_buffer_size_mb = config.get("OVERFLOW_BUFFER_SIZE_MB", 0)
+        self.overflow_buffer_path = config.get("OVERFLOW_BUFFER_PATH", None)
+        self.shared_memory_name = config.get("SHARED_MEMORY_NAME", None)
+        self.buffer_latency_ms = config.get("BUFFER_LATENCY_MS", None)
+        self.buffer_history_seconds = config.get("BUFFER_HISTORY_SECONDS", None)
         self.sml = None
+        self.inference_workers = []
+        self.sml_library_paths = list(
+            config.get("SML_LIBRARY_PATHS") or [self.sml_library_path]
+        )
+        # results and swaps name a knowledge pack by the path it was configured with
+        self.sml_library_names = []
+        for sml_library_path in self.sml_library_paths:
+            self.sml_library_names.append(
+                self._unique_knowledge_pack_name(sml_library_path)
+            )
+        self.sml_model_indexes = config.get("SML_MODEL_INDEXES") or [0]
+        self.sml_instrument = config.get("SML_INSTRUMENT", False)
+        self.capture_features = config.get("SML_CAPTURE_FEATURES", False)
+        self.inference_queue_size = config.get(
+            "INFERENCE_QUEUE_SIZE", INFERENCE_QUEUE_SIZE
+        )
         self.sample_rate = None
         self.config_columns = None
         self.device_id = device_id
@@ -42,6 +127,9 @@ class BaseReader(object):
         self._record_thread = None
         self.buffer = None
         self.rbuffer = None
+        self.fbuffer = None
+        self.sbuffer = None
+        self.saturated_samples = 0
         self._lock = threading.Lock()
 
     @property
@@ -72,6 +160,15 @@ class BaseReader(object):
 
         return INT16_BYTE_SIZE
 
+    @property
+    def data_type_numpy(self):
+        if self.data_type == "int16":
+            return "<i2"
+        elif self.data_type == "float":
+            return "<f4"
+
+        return "<i2"
+
     @property
     def data_type_cast(self):
         if self.data_type == "int16":
@@ -89,6 +186,56 @@ class BaseReader(object):
     def packet_buffer_size(self):
         return self.samples_per_packet * self.source_buffer_size
 
+    @property
+    def slot_samples(self):
+        """samples held by one buffer slot, derived from BUFFER_LATENCY_MS when set"""
+        if self.buffer_latency_ms and self.sample_rate:
+            return max(
+                int(round(float(self.sample_rate) * self.buffer_latency_ms / 1000.0)),
+                1,
+            )
+
+        return max(self.packet_buffer_size // max(self.data_width_bytes, 1), 1)
+
+    @property
+    def slot_size(self):
+        """bytes held by one buffer slot"""
+        if self.buffer_latency_ms and self.sample_rate:
+            return self.slot_samples * self.data_width_bytes
+
+        return self.packet_buffer_size
+
+    @property
+    def num_slots(self):
+        """slots in the ring, enough for BUFFER_HISTORY_SECONDS when set"""
+        if self.buffer_history_seconds and self.sample_rate:
+            history_samples = float(self.sample_rate) * self.buffer_history_seconds
+            # the slot being filled holds no history, it comes on top of the sealed ones
+            return int(math.ceil(history_samples / self.slot_samples)) + 1
+
+        return DEFAULT_NUM_SLOTS
+
+    def get_buffer_geometry(self):
+        """Slot size, slot count and the latency and history they amount to"""
+
+        geometry = {
+            "slot_samples": self.slot_samples,
+            "slot_bytes": self.slot_size,
+            "num_slots": self.num_slots,
+            "memory_bytes": self.slot_size * self.num_slots,
+            "slot_latency_ms": None,
+            "history_seconds": None,
+        }
+
+        if self.sample_rate:
+            sample_rate = float(self.sample_rate)
+            geometry["slot_latency_ms"] = 1000.0 * self.slot_samples / sample_rate
+            geometry["history_seconds"] = (
+                self.slot_samples * (self.num_slots - 1) / sample_rate
+            )
+
+        return geometry
+
     @property
     def source_buffer_size(self):
         if self.source_samples_per_packet is None:
@@ -169,15 +316,78 @@ class BaseReader(object):
         self.class_map = config.get("CLASS_MAP")
         self.data_type = config.get("DATA_TYPE", "int16")
 
-    def connect(self):
+    def connect(self, backpressure_policy=None, record_backpressure_policy=None):
+        """Connect to the source and start buffering its data.
+
+        Args:
+            backpressure_policy(str): policy of the live stream consumers when they fall
+                behind, one of drop-oldest, drop-newest, block or spill
+            record_backpressure_policy(str): policy of the recorder, spill by default,
+                which keeps recordings lossless by spooling to disk. block stalls the
+                source while the recorder is behind, for up to BACKPRESSURE_TIMEOUT,
+                after which the oldest data is dropped
+        """
+
+        if backpressure_policy is not None:
+            self.backpressure_policy = backpressure_policy
+
+        if record_backpressure_policy is not None:
+            self.record_backpressure_policy = record_backpressure_policy
+
         if self._thread is None:
             "Assume if there is a thread, we are already connected"
 
-            self.buffer = CircularBufferQueue(
-                self._lock, buffer_size=self.packet_buffer_size
-            )
+            buffer_kwargs = {
+                "num_buffers": self.num_slots,
+                "buffer_size": self.slot_size,
+                "block_timeout": self.backpressure_timeout,
+                "overflow_slots": self.overflow_buffer_size_mb
+                * 1024
+                * 1024
+                // self.slot_size,
+                "overflow_path": self.overflow_buffer_path,
+                "sample_size": self.data_width_bytes,
+            }
+
+            if isinstance(self.buffer, SharedMemoryCircularBufferQueue):
+                # release the name so the new ring can be published under it
+                self.buffer.close()
+
+            if self.shared_memory_name:
+                self.buffer = SharedMemoryCircularBufferQueue(
+                    self._lock, self.shared_memory_name, **buffer_kwargs
+                )
+                self.buffer.set_metadata(
+                    {
+                        "device_id": self.device_id,
+                        "data_type": self.data_type,
+                        "dtype": self.data_type_numpy,
+                        "data_width": self.data_width,
+                        "sample_rate": self.sample_rate,
+                        "columns": self.config_columns,
+                    }
+                )
+            else:
+                self.buffer = PreallocatedCircularBufferQueue(
+                    self._lock, **buffer_kwargs
+                )
             self.rbuffer = CircularResultsBufferQueue(self._lock, buffer_size=1)
 
+            if self.capture_features:
+                self.fbuffer = CircularResultsBufferQueue(self._lock, buffer_size=1)
+
+            if self.use_sample_buffer:
+                # hold the same history as the byte ring, in decoded samples
+                self.sbuffer = CircularSampleBufferQueue(
+                    self._lock,
+                    capacity_samples=self.buffer._num_buffers
+                    * self.slot_size
+                    // self.data_width_bytes,
+                    data_width=self.data_width,
+                    dtype=self.data_type_numpy,
+                    block_timeout=self.backpressure_timeout,
+                )
+
             print("Base: Sending subscribe to source")
             self._send_subscribe()
 
@@ -195,15 +405,180 @@ class BaseReader(object):
         else:
             print("Base: Thread Already Started!")
 
+    def get_stats(self):
+        """Buffer and consumer statistics for the connected source"""
+
+        stats = {
+            "streaming": self.is_streaming(),
+            "recording": self.is_recording(),
+            "saturated_samples": self.saturated_samples,
+        }
+
+        if self.buffer is not None:
+            stats["buffer"] = self.buffer.get_stats()
+
+        if self.rbuffer is not None:
+            stats["results_buffer"] = self.rbuffer.get_stats()
+
+        if self.fbuffer is not None:
+            stats["features_buffer"] = self.fbuffer.get_stats()
+
+        if self.sbuffer is not None:
+            stats["sample_buffer"] = self.sbuffer.get_stats()
+
+        if self.inference_workers:
+            stats["inference"] = [
+                worker.get_stats() for worker in self.inference_workers
+            ]
+
+        return stats
+
+    def get_snapshot(self, seconds):
+        """The last seconds of the stream held in memory, without waiting on the source.
+
+        Returns the running index of the first sample and the samples as bytes in the
+        same format /stream produces.
+        """
+
+        sample_index, data = self.buffer.snapshot(seconds)
+
+        if data and self.convert_to_int16 and self.data_type_str == "f":
+            data = self.convert_data_to_int16(data)
+
+        return sample_index, data
+
     def disconnect(self):
         self.streaming = False
         self._thread = None
         self._record_thread = None
         self.recording = False
 
+        self._stop_inference()
+
         self.buffer.reset_buffer()
         self.rbuffer.reset_buffer()
 
+        if self.fbuffer is not None:
+            self.fbuffer.reset_buffer()
+
+        if self.sbuffer is not None:
+            self.sbuffer.reset_buffer()
+
+    def _update_buffers(self, data):
+        """Store a packet read from the source.
+
+        Returns the packet decoded as a (samples, data_width) array when the sample buffer
+        is enabled so the caller can reuse it, otherwise None.
+        """
+
+        self.buffer.update_buffer(data)
+
+        samples = None
+        if self.sbuffer is not None:
+            samples = self.sbuffer.update_buffer(data)
+
+        if self.convert_to_int16 and self.data_type_str == "f":
+            # counted once here, every consumer converts the packet on its own
+            self._count_saturated(data, samples)
+
+        if self.inference_workers:
+            # decoded at most once, by whichever worker gets to it first
+            packet = InferencePacket(self, data, samples)
+            for worker in self.inference_workers:
+                worker.submit(packet)
+
+        return samples
+
+    def _start_inference(self):
+        """Run the knowledge packs on workers fed by _update_buffers, if enabled.
+
+        Every library in SML_LIBRARY_PATHS gets its own worker, which runs each of the
+        SML_MODEL_INDEXES. A library listed more than once is staged to its own copy for
+        every repeat, a process loads a path only once and the copies would otherwise
+        share the knowledge pack state.
+        """
+
+        if not self.run_sml_model:
+            return
+
+        self._stop_inference()
+
+        # only name the knowledge pack on results when there is more than one
+        tag = len(self.sml_library_paths) > 1
+
+        loaded = set()
+        for index, name in enumerate(self.sml_library_names):
+            sml_library_path = self.sml_library_paths[index]
+
+            if sml_library_path in loaded and not is_emulator_path(sml_library_path):
+                sml_library_path = stage_knowledge_pack(sml_library_path)
+                self.sml_library_paths[index] = sml_library_path
+            loaded.add(sml_library_path)
+
+            worker = InferenceWorker(
+                self,
+                sml_library_path,
+                model_indexes=self.sml_model_indexes,
+                name=name if tag else None,
+                queue_size=self.inference_queue_size,
+            )
+            worker.start()
+            self.inference_workers.append(worker)
+
+    def _unique_knowledge_pack_name(self, sml_library_path):
+        """sml_library_path, suffixed when another knowledge pack already has the name"""
+        name = str(sml_library_path)
+        count = 1
+        while name in self.sml_library_names:
+            count += 1
+            name = "{}#{}".format(sml_library_path, count)
+
+        return name
+
+    def swap_knowledge_pack(self, sml_library_path, name=None):
+        """Hot swap the knowledge pack of a running inference worker.
+
+        name selects the worker when several knowledge packs are loaded. The new library
+        is loaded next to the running one and takes over between two packets, later
+        connections load it from the start.
+        """
+
+        if not self.inference_workers:
+            raise Exception("No knowledge pack is running on this source")
+
+        if name is None and len(self.inference_workers) == 1:
+            worker = self.inference_workers[0]
+        else:
+            workers = [w for w in self.inference_workers if w.name == name]
+            if not workers:
+                raise Exception("No knowledge pack named {}".format(name))
+            worker = workers[0]
+
+        staged_path = worker.swap_model(sml_library_path)
+
+        # later connections load the staged copy, the original path may be cached
+        index = self.inference_workers.index(worker)
+        self.sml_library_paths[index] = staged_path
+        self.sml_library_names[index] = None
+        self.sml_library_names[index] = self._unique_knowledge_pack_name(
+            sml_library_path
+        )
+        if worker.name is not None:
+            worker.name = self.sml_library_names[index]
+        if index == 0:
+            self.sml_library_path = staged_path
+
+    def _stop_inference(self):
+        for index, worker in enumerate(self.inference_workers):
+            worker.stop()
+
+            # a swap that failed or never finished leaves the previous knowledge pack
+            self.sml_library_paths[index] = worker.sml_library_path
+            if index == 0:
+                self.sml_library_path = worker.sml_library_path
+
+        self.inference_workers = []
+
     def record_start(self, filename):
         if not self.streaming:
             raise Exception("Must start streaming before beginning to record!")
@@ -237,64 +612,136 @@ class BaseReader(object):
 
         return True
 
-    def convert_data_to_list(self, data):
-        num_samples = len(data) // self.data_byte_size
+    def decode_samples(self, data):
+        """Decode a packet of raw bytes into a (samples, data_width) array"""
+
+        return np.frombuffer(data, dtype=self.data_type_numpy).reshape(
+            -1, self.data_width
+        )
 
-        tmp = struct.unpack(self.data_type_str * num_samples, data)
+    def convert_data_to_list(self, data, samples=None):
+        if samples is None:
+            samples = self.decode_samples(data)
 
-        tmp = [x * self.scaling_factor for x in tmp]
+        tmp = (samples[: self.source_samples_per_packet] * self.scaling_factor).tolist()
 
-        for index in range(self.source_samples_per_packet):
-            yield tmp[index * self.data_width : (index + 1) * self.data_width]
+        for sample in tmp:
+            yield sample
 
     def convert_data_to_int16(self, data):
         num_samples = len(data) // self.data_byte_size
 
-        tmp = struct.unpack(self.data_type_str * num_samples, data)
+        samples = np.frombuffer(data, dtype=self.data_type_numpy, count=num_samples)
+        scaled = np.multiply(samples, self.scaling_factor, dtype=np.float64)
 
-        sample_data = bytearray(num_samples * 2)
+        # values past the int16 range are pinned to it instead of wrapping
+        np.clip(scaled, INT16_MIN, INT16_MAX, out=scaled)
 
-        for index in range(num_samples):
-            # print(tmp[index])
+        return scaled.astype("<i2").tobytes()
 
-            struct.pack_into(
-                "<" + "h", sample_data, index * 2, int(tmp[index] * self.scaling_factor)
+    def _count_saturated(self, data, samples=None):
+        """Count the values of a packet that convert_data_to_int16 pins to int16"""
+        if samples is None:
+            samples = np.frombuffer(
+                data,
+                dtype=self.data_type_numpy,
+                count=len(data) // self.data_byte_size,
             )
 
-        return bytes(sample_data)
+        scaled = np.multiply(samples, self.scaling_factor, dtype=np.float64)
+        self.saturated_samples += int(
+            np.count_nonzero((scaled > INT16_MAX) | (scaled < INT16_MIN))
+        )
+
+    def get_sml_model_obj(self, sml_library_path=None):
+        if sml_library_path is None:
+            sml_library_path = self.sml_library_path
 
-    def get_sml_model_obj(self):
-        sml = SMLRunner(os.path.join(self.sml_library_path))
+        if is_emulator_path(sml_library_path):
+            sml = SMLEmulator.from_path(
+                sml_library_path, instrument=self.sml_instrument
+            )
+        else:
+            sml = SMLRunner(
+                os.path.join(sml_library_path), instrument=self.sml_instrument
+            )
         sml.init_model()
         print("Model initialized")
 
         return sml
 
-    def execute_run_sml_model(self, sml, data):
-        for data_chunk in self.convert_data_to_list(data):
-            ret = sml.run_model(data_chunk, 0)
-            if ret >= 0:
-                print(
-                    self._map_classification({"ModelNumber": 0, "Classification": ret})
-                )
-                sml.reset_model(0)
-                return self._map_classification(
-                    {"ModelNumber": 0, "Classification": ret}
-                )
+    def convert_data_to_batch(self, data, samples=None):
+        """The packet as a (samples, data_width) int16 array scaled for the model"""
+        if samples is None:
+            samples = self.decode_samples(data)
 
-    def _map_classification(self, results):
-        if self.model_json:
-            results["Classification"] = self.model_json["ModelDescriptions"][
-                results["ModelNumber"]
-            ]["ClassMaps"][str(results["Classification"])]
-
-        elif self.class_map:
-            results["Classification"] = self.class_map.get(
-                results["Classification"], results["Classification"]
+        return scale_to_int16(
+            samples[: self.source_samples_per_packet], self.scaling_factor
+        )
+
+    def execute_run_sml_model(
+        self,
+        sml,
+        data,
+        samples=None,
+        model_index=0,
+        batch=None,
+        knowledge_pack=None,
+    ):
+        """Feed the packet to the model, returns every classification it produced.
+
+        batch is the packet already converted by convert_data_to_batch, pass it instead
+        of data to share one conversion between models.
+        """
+
+        if batch is None:
+            batch = self.convert_data_to_batch(data, samples=samples)
+
+        captured = {}
+
+        def capture_features(offset, ret):
+            captured[offset] = (
+                sml.get_feature_vector(model_index),
+                sml.get_model_result_outputs(model_index),
             )
 
+        results = []
+        features = []
+        for offset, ret in sml.run_model_batch(
+            batch,
+            model_index,
+            on_classification=capture_features if self.fbuffer is not None else None,
+        ):
+            result = {
+                "ModelNumber": model_index,
+                "Classification": ret,
+                "SampleOffset": offset,
+            }
+            if knowledge_pack is not None:
+                result["KnowledgePack"] = knowledge_pack
+
+            result = self._map_classification(result)
+            print(result)
+            results.append(result)
+
+            if offset in captured:
+                feature_vector, output_tensor = captured[offset]
+                features.append(
+                    dict(
+                        result,
+                        FeatureVector=feature_vector,
+                        OutputTensor=output_tensor,
+                    )
+                )
+
+        if features:
+            self.fbuffer.update_buffer(features)
+
         return results
 
+    def _map_classification(self, results):
+        return map_classification(results, self.model_json, self.class_map)
+
 
 class BaseStreamReaderMixin(object):
     def read_result_data(self):
@@ -308,32 +755,57 @@ class BaseStreamReaderMixin(object):
             self.connect()
             self.streaming = True
 
-        index = self.rbuffer.get_latest_buffer()
+        rbuffer = self.rbuffer
+        cursor = rbuffer.register_cursor(name="result stream")
 
-        rand = random.randint(0, 100)
+        try:
+            while self.streaming:
+                data = rbuffer.read_next(cursor, timeout=BUFFER_WAIT_TIMEOUT)
 
-        while self.streaming:
-            if index is None:
-                index = self.rbuffer.get_latest_buffer()
-                time.sleep(0.1)
-                continue
-
-            if self.rbuffer.is_buffer_full(index):
-                data = self.rbuffer.read_buffer(index)
-                index = self.rbuffer.get_next_index(index)
+                if data is None:
+                    continue
 
                 for result in data:
                     if result:
-                        result["timestamp"] = time.time()
-                        print("reader", index, result)
+                        # slots are shared between readers, stamp a copy of the result
+                        result = dict(result, timestamp=time.time())
+                        print("reader", cursor.sequence, result)
                         yield json.dumps(result) + "\n"
-
-            else:
-                time.sleep(0.1)
+        finally:
+            rbuffer.unregister_cursor(cursor)
 
         print("ResultReader: Result stream ended")
 
-    def read_data(self):
+    def read_feature_data(self):
+        """Generator of the captured feature vectors as newline delimited json"""
+
+        print("StreamReader: New feature reader connected")
+
+        if self._thread:
+            pass
+        else:
+            print("StreamReader: establishing a connection to the device.")
+            self.connect()
+            self.streaming = True
+
+        fbuffer = self.fbuffer
+        cursor = fbuffer.register_cursor(name="feature stream")
+
+        try:
+            while self.streaming:
+                data = fbuffer.read_next(cursor, timeout=BUFFER_WAIT_TIMEOUT)
+
+                if data is None:
+                    continue
+
+                for features in data:
+                    yield json.dumps(dict(features, timestamp=time.time())) + "\n"
+        finally:
+            fbuffer.unregister_cursor(cursor)
+
+        print("StreamReader: Feature stream ended")
+
+    def read_data(self, on_overrun=OVERRUN_SKIP, name="stream", policy=None):
         """Generator to read the data stream out of the buffer"""
 
         print("StreamReader: New stream reader connected")
@@ -346,25 +818,38 @@ class BaseStreamReaderMixin(object):
             self.connect()
             self.streaming = True
 
-        index = self.buffer.get_latest_buffer()
+        buffer = self.buffer
+        cursor = buffer.register_cursor(
+            on_overrun=on_overrun,
+            name=name,
+            policy=policy if policy is not None else self.backpressure_policy,
+        )
+
+        # conversion already produces new bytes, so it can read the slot in place
+        convert = self.convert_to_int16 and self.data_type_str == "f"
 
-        while self.streaming:
-            if index is None:
-                index = self.buffer.get_latest_buffer()
-                time.sleep(0.1)
-                continue
+        try:
+            while self.streaming:
+                data = buffer.read_available(
+                    cursor,
+                    max_slots=STREAM_MAX_SLOTS,
+                    timeout=BUFFER_WAIT_TIMEOUT,
+                    copy=not convert,
+                )
 
-            if self.buffer.is_buffer_full(index):
-                data = self.buffer.read_buffer(index)
-                index = self.buffer.get_next_index(index)
+                if data is None:
+                    continue
 
-                if self.convert_to_int16 and self.data_type_str == "f":
+                if convert:
                     data = self.convert_data_to_int16(data)
 
+                    if buffer.slot_overwritten(cursor):
+                        continue
+
                 if data:
                     yield data
-
-            time.sleep(0.001)
+        finally:
+            buffer.unregister_cursor(cursor)
 
         print("StreamReader: Stream Ended")
 
@@ -381,24 +866,83 @@ class BaseStreamReaderMixin(object):
                     )
                 ]
             )
-            struct_info = self.data_type_str * self.data_width
 
-            data_reader = self.read_data()
+            # the sample buffer can't spill, spilled recordings read the packet buffer
+            if (
+                self.sbuffer is not None
+                and self.record_backpressure_policy != POLICY_SPILL
+            ):
+                self._record_samples(datawriter)
+            else:
+                self._record_packets(datawriter)
+
+        print("StreamReader: CSV recording thread finished")
 
+    def _record_packets(self, datawriter):
+        buffer = self.buffer
+        # the recorder owns its cursor so a slow /stream client can't skip it ahead,
+        # and it is told about every gap instead of silently reading overwritten data.
+        # The cursor is kept for the whole recording so a gap never drops the backlog
+        cursor = buffer.register_cursor(
+            on_overrun=OVERRUN_RAISE,
+            name="recorder",
+            policy=self.record_backpressure_policy,
+        )
+
+        try:
             while self.recording:
-                data = next(data_reader)
+                try:
+                    data = buffer.read_available(
+                        cursor,
+                        max_slots=STREAM_MAX_SLOTS,
+                        timeout=BUFFER_WAIT_TIMEOUT,
+                        copy=True,
+                    )
+                except BufferOverrunException as e:
+                    print("StreamReader: Recording fell behind the source!", e)
+                    continue
 
                 if data:
-                    for row_index in range(len(data) // (self.data_width_bytes)):
-                        buff_index = row_index * self.data_width_bytes
-                        datawriter.writerow(
-                            struct.unpack(
-                                struct_info,
-                                data[buff_index : buff_index + self.data_width_bytes],
-                            )
-                        )
+                    self._write_packet_rows(datawriter, data)
+        finally:
+            buffer.unregister_cursor(cursor)
 
-        print("StreamReader: CSV recording thread finished")
+    def _write_packet_rows(self, datawriter, data):
+        struct_info = self.data_type_str * self.data_width
+
+        for row_index in range(len(data) // (self.data_width_bytes)):
+            buff_index = row_index * self.data_width_bytes
+            datawriter.writerow(
+                struct.unpack(
+                    struct_info,
+                    data[buff_index : buff_index + self.data_width_bytes],
+                )
+            )
+
+    def _record_samples(self, datawriter):
+        """Write rows straight from the decoded sample buffer"""
+
+        sbuffer = self.sbuffer
+        cursor = sbuffer.register_cursor(
+            on_overrun=OVERRUN_RAISE,
+            name="recorder",
+            policy=self.record_backpressure_policy,
+        )
+
+        try:
+            while self.recording:
+                try:
+                    samples = sbuffer.read_next(
+                        cursor, timeout=BUFFER_WAIT_TIMEOUT, copy=True
+                    )
+                except BufferOverrunException as e:
+                    print("StreamReader: Recording fell behind the source!", e)
+                    continue
+
+                if samples is not None:
+                    datawriter.writerows(samples.tolist())
+        finally:
+            sbuffer.unregister_cursor(cursor)
 
 
 class BaseResultReaderMixin(object):
@@ -417,19 +961,15 @@ class BaseResultReaderMixin(object):
             print("sent connect")
             self.connect()
 
-        index = self.rbuffer.get_latest_buffer()
-
-        rand = random.randint(0, 100)
+        rbuffer = self.rbuffer
+        cursor = rbuffer.register_cursor(name="results")
 
-        while self.streaming:
-            if index is None:
-                index = self.rbuffer.get_latest_buffer()
-                time.sleep(0.1)
-                continue
+        try:
+            while self.streaming:
+                data = rbuffer.read_next(cursor, timeout=BUFFER_WAIT_TIMEOUT)
 
-            if self.rbuffer.is_buffer_full(index):
-                data = self.rbuffer.read_buffer(index)
-                index = self.rbuffer.get_next_index(index)
+                if data is None:
+                    continue
 
                 for result in data:
                     if self._validate_results_data(result):
@@ -448,11 +988,10 @@ class BaseResultReaderMixin(object):
                             print(e)
                             continue
                         result["timestamp"] = time.time()
-                        print(index, result)
+                        print(cursor.sequence, result)
                         yield json.dumps(result) + "\n"
-
-            else:
-                time.sleep(0.1)
+        finally:
+            rbuffer.unregister_cursor(cursor)
 
         print("ResultReader: Result stream ended")
 
@@ -154,7 +154,7 @@ class BLEStreamReader(BLEReader, BaseStreamReaderMixin):
                         self.delegate.new_data = False
                         self.delegate.data = b""
 
-                    self.buffer.update_buffer(tmp)
+                    self._update_buffers(tmp)
                     time.sleep(0.00001)
 
         except Exception as e:
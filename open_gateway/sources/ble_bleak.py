@@ -128,7 +128,7 @@ class BLEStreamReader(BLEReader, BaseStreamReaderMixin):
     charUUID = uuidOfDataChar
 
     def handleNotification(self, cHandle: int, value: bytearray):
-        self.buffer.update_buffer(value)
+        self._update_buffers(value)
 
 
 class BLEResultReader(BLEReader, BaseResultReaderMixin):
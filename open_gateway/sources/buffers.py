@@ -1,14 +1,224 @@
+import collections
 import copy
+import json
+import mmap
+import pickle
+import struct
+import tempfile
+import threading
 import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+OVERRUN_SKIP = "skip"
+OVERRUN_RAISE = "raise"
+
+# what the producer does when writing would overwrite a slot a consumer has not read
+POLICY_DROP_OLDEST = "drop-oldest"
+POLICY_DROP_NEWEST = "drop-newest"
+POLICY_BLOCK = "block"
+POLICY_SPILL = "spill"
+
+BACKPRESSURE_POLICIES = [
+    POLICY_DROP_OLDEST,
+    POLICY_DROP_NEWEST,
+    POLICY_BLOCK,
+    POLICY_SPILL,
+]
+
+
+class BufferOverrunException(Exception):
+    pass
+
+
+class BufferReadySignal(object):
+    """Wakes a consumer of several buffers as soon as any of them seals a slot.
+
+    Buffers notify the signals added with add_listener from inside their own lock. A
+    consumer takes the version before checking its buffers and then waits for it to
+    change, so it never holds the signal while taking a buffer lock.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def notify(self):
+        with self._condition:
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout=None):
+        """Block until a slot was sealed after version was read, False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != version, timeout)
+
+
+class BufferSpillFile(object):
+    """On-disk queue of the slots a spilling consumer had not read when they were reused"""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._pending = collections.deque()
+        self._end = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def write(self, sequence, data):
+        self._file.seek(self._end)
+        self._file.write(data)
+        self._pending.append((sequence, self._end, len(data)))
+        self._end += len(data)
+
+    def read(self):
+        sequence, offset, length = self._pending.popleft()
+        self._file.seek(offset)
+        data = self._file.read(length)
+
+        if not self._pending:
+            self._file.seek(0)
+            self._file.truncate()
+            self._end = 0
+
+        return sequence, data
+
+    def close(self):
+        self._file.close()
+
+
+class MmapOverflowTier(object):
+    """Bounded memory-mapped file holding the slots evicted from an in-memory ring
+
+    Slots are stored by sequence in a ring of num_slots fixed size records, so the file
+    never grows past num_slots * slot_size bytes. Each record remembers the sequence it
+    holds, reading a sequence that has since been overwritten returns None.
+    """
+
+    def __init__(self, num_slots, slot_size, path=None):
+        self._num_slots = num_slots
+        self._slot_size = slot_size
+        self._file = tempfile.TemporaryFile(dir=path)
+        self._file.truncate(num_slots * slot_size)
+        self._map = mmap.mmap(self._file.fileno(), num_slots * slot_size)
+        self._sequences = [-1] * num_slots
+        self._lengths = [0] * num_slots
+        self._stored = 0
+        self._reads = 0
+
+    @property
+    def num_slots(self):
+        return self._num_slots
+
+    def store(self, sequence, data):
+        index = sequence % self._num_slots
+        start = index * self._slot_size
+
+        self._map[start : start + len(data)] = data
+        self._sequences[index] = sequence
+        self._lengths[index] = len(data)
+        self._stored += 1
+
+    def read(self, sequence):
+        index = sequence % self._num_slots
+
+        if self._sequences[index] != sequence:
+            return None
+
+        start = index * self._slot_size
+        self._reads += 1
+
+        return self._map[start : start + self._lengths[index]]
+
+    def get_stats(self):
+        return {
+            "num_slots": self._num_slots,
+            "file_size": self._num_slots * self._slot_size,
+            "stored": self._stored,
+            "reads": self._reads,
+        }
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class BufferCursor(object):
+    """Read position of a single consumer of a CircularBufferQueue
+
+    sequence is the running number of the next slot the consumer will read. The slot
+    index is sequence % num_buffers, so the buffer can tell when the producer has lapped
+    the consumer and the slots it was about to read have been overwritten.
+    """
+
+    def __init__(
+        self, sequence, on_overrun=OVERRUN_SKIP, name=None, policy=POLICY_DROP_OLDEST
+    ):
+        if on_overrun not in (OVERRUN_SKIP, OVERRUN_RAISE):
+            raise Exception("Invalid overrun policy {}".format(on_overrun))
+
+        if policy not in BACKPRESSURE_POLICIES:
+            raise Exception("Invalid backpressure policy {}".format(policy))
+
+        self.sequence = sequence
+        self.on_overrun = on_overrun
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+        self.overruns = 0
+        self.spilled = 0
+        self.spill = BufferSpillFile() if policy == POLICY_SPILL else None
+        # first slot of the data last returned, and whether it was a private copy
+        self.last_sequence = sequence
+        self.detached = False
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+    def info(self):
+        return {
+            "name": self.name,
+            "sequence": self.sequence,
+            "on_overrun": self.on_overrun,
+            "policy": self.policy,
+            "dropped": self.dropped,
+            "overruns": self.overruns,
+            "spilled": self.spilled,
+            "spill_pending": len(self.spill) if self.spill is not None else 0,
+        }
 
 
 class CircularBufferQueue(object):
-    def __init__(self, lock, num_buffers=256, buffer_size=128):
+    def __init__(self, lock, num_buffers=256, buffer_size=128, block_timeout=1.0):
         self._lock = lock
-        self._data = [self.get_empty() for _ in range(num_buffers)]
+        self._data_ready = threading.Condition(lock)
+        self._space_available = threading.Condition(lock)
         self._index = 0
+        self._sequence = 0
+        self._cursors = []
         self._maxsize = buffer_size
         self._num_buffers = num_buffers
+        self._block_timeout = block_timeout
+        self._overflow = None
+        self._listeners = []
+        self._policy_stats = {
+            "dropped_newest_packets": 0,
+            "dropped_newest_bytes": 0,
+            "block_waits": 0,
+            "block_timeouts": 0,
+            "blocked_seconds": 0.0,
+            "spilled": 0,
+        }
+        self._init_storage()
+
+    def _init_storage(self):
+        self._data = [self.get_empty() for _ in range(self._num_buffers)]
 
     def get_empty(self):
         return b""
@@ -19,13 +229,98 @@ class CircularBufferQueue(object):
         for i in range(self._num_buffers):
             print(i, "len:", len(self._data[i]))
 
+    def _clear_slot(self, index):
+        self._data[index] = self.get_empty()
+
+    def _slot_length(self, index):
+        return len(self._data[index])
+
+    def _serialize_slot(self, data):
+        return pickle.dumps(data)
+
+    def _deserialize_slot(self, data):
+        return pickle.loads(data)
+
     def _increment(self):
-        """Increment and clear next buffer"""
+        """Increment and clear next buffer, waking any consumer waiting on a full slot"""
+        self._reclaim_slot(self._sequence + 1 - self._num_buffers)
         self._index = (self._index + 1) % self._num_buffers
-        self._data[self._index] = self.get_empty()
+        self._sequence += 1
+        self._clear_slot(self._index)
+        self._data_ready.notify_all()
+
+        for listener in self._listeners:
+            listener.notify()
+
+    def add_listener(self, signal):
+        """Notify the BufferReadySignal every time a slot is sealed"""
+        with self._lock:
+            self._listeners.append(signal)
+
+    def remove_listener(self, signal):
+        with self._lock:
+            if signal in self._listeners:
+                self._listeners.remove(signal)
+
+    def _reclaim_slot(self, sequence):
+        """Apply the consumers' backpressure policies before the slot holding sequence is reused"""
+
+        if sequence < 0:
+            return
+
+        def blocking_cursors_done():
+            return all(
+                cursor.sequence > sequence
+                for cursor in self._cursors
+                if cursor.policy == POLICY_BLOCK
+            )
+
+        if not blocking_cursors_done():
+            self._policy_stats["block_waits"] += 1
+            start = time.time()
+            if not self._space_available.wait_for(
+                blocking_cursors_done, self._block_timeout
+            ):
+                self._policy_stats["block_timeouts"] += 1
+            self._policy_stats["blocked_seconds"] += time.time() - start
+
+        for cursor in self._cursors:
+            if cursor.policy == POLICY_SPILL and cursor.sequence <= sequence:
+                cursor.spill.write(
+                    sequence,
+                    self._serialize_slot(self._read_slot(self.get_index(sequence))),
+                )
+                cursor.spilled += 1
+                self._policy_stats["spilled"] += 1
+
+        # only pay for the copy to disk while some consumer still needs the slot
+        if self._overflow is not None and any(
+            cursor.sequence <= sequence for cursor in self._cursors
+        ):
+            self._overflow.store(sequence, self._read_slot(self.get_index(sequence)))
+
+    def _drop_newest(self, size):
+        """True if storing size more bytes would reuse a slot a drop-newest consumer has not read"""
+
+        increments = (self._slot_length(self._index) + size) // self._maxsize
+        last_reclaimed = self._sequence + increments - self._num_buffers
+
+        for cursor in self._cursors:
+            if (
+                cursor.policy == POLICY_DROP_NEWEST
+                and cursor.sequence <= last_reclaimed
+            ):
+                self._policy_stats["dropped_newest_packets"] += 1
+                self._policy_stats["dropped_newest_bytes"] += size
+                return True
+
+        return False
 
     def update_buffer(self, data):
         with self._lock:
+            if self._drop_newest(len(data)):
+                return
+
             size = len(self._data[self._index]) + len(data)
 
             if size > self._num_buffers * self._maxsize:
@@ -61,23 +356,263 @@ class CircularBufferQueue(object):
 
         return False
 
+    @staticmethod
+    def get_data_iterator(buffer, data_width):
+        for i in range(len(buffer) // (data_width * 2)):
+            buff_index = i * data_width * 2
+            yield buffer[buff_index : buff_index + data_width * 2]
+
+        yield None
+
     def get_buffer_iterator(self, index, data_width):
-        def buffer_iterator(buffer, data_width):
-            for i in range(len(buffer) // (data_width * 2)):
-                buff_index = i * data_width * 2
-                yield buffer[buff_index : buff_index + data_width * 2]
+        return self.get_data_iterator(self.read_buffer(index), data_width)
 
-            yield None
+    def _read_slot(self, index):
+        """Reference to the slot data, full slots are replaced by _clear_slot and never
+        modified in place so the reference stays stable after the lock is released"""
+        return self._data[index]
 
-        return buffer_iterator(copy.deepcopy(self._data[index]), data_width)
+    def _copy_slot(self, data):
+        return copy.deepcopy(data)
 
-    def read_buffer(self, buffer_index):
+    def read_buffer(self, buffer_index, copy=False):
         with self._lock:
-            return copy.deepcopy(self._data[buffer_index])
+            data = self._read_slot(buffer_index)
+
+        if copy:
+            return self._copy_slot(data)
+
+        return data
+
+    def register_cursor(
+        self, on_overrun=OVERRUN_SKIP, name=None, policy=POLICY_DROP_OLDEST
+    ):
+        """Register a consumer starting at the latest full slot.
+
+        Args:
+            on_overrun(str): "skip" jumps a lapped cursor to the newest full slot, "raise"
+                moves it to the oldest slot still in the buffer and raises
+                BufferOverrunException so the consumer can record the gap.
+            name(str): label used when reporting the consumer's statistics
+            policy(str): what the producer does when it is about to overwrite a slot this
+                consumer has not read.
+                    drop-oldest - overwrite it, the consumer sees an overrun
+                    drop-newest - discard the incoming packet instead
+                    block - wait up to block_timeout for the consumer to catch up
+                    spill - write the slot to a temporary file the consumer reads first
+        """
+
+        with self._lock:
+            cursor = BufferCursor(
+                max(self._sequence - 1, 0),
+                on_overrun=on_overrun,
+                name=name,
+                policy=policy,
+            )
+            self._cursors.append(cursor)
+
+            return cursor
+
+    def unregister_cursor(self, cursor):
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+                cursor.close()
+                self._space_available.notify_all()
+
+    def _oldest_memory_sequence(self):
+        """running number of the oldest full slot that has not been overwritten in memory"""
+        return max(self._sequence - self._num_buffers + 1, 0)
+
+    def _oldest_sequence(self):
+        """running number of the oldest slot a consumer can still read"""
+        if self._overflow is not None:
+            return max(self._oldest_memory_sequence() - self._overflow.num_slots, 0)
+
+        return self._oldest_memory_sequence()
+
+    def _check_overrun(self, cursor):
+        oldest = self._oldest_sequence()
+
+        if cursor.sequence >= oldest:
+            return
+
+        cursor.overruns += 1
+
+        if cursor.on_overrun == OVERRUN_RAISE:
+            missed = oldest - cursor.sequence
+            cursor.dropped += missed
+            cursor.sequence = oldest
+            raise BufferOverrunException(
+                "Consumer {} fell behind the producer, {} buffers were overwritten".format(
+                    cursor.name, missed
+                )
+            )
+
+        newest = self._sequence - 1
+        cursor.dropped += newest - cursor.sequence
+        cursor.sequence = newest
+
+    def _is_sequence_valid(self, sequence):
+        return sequence >= self._oldest_memory_sequence()
+
+    def slot_timestamp(self, sequence):
+        """monotonic time the slot holding sequence was sealed, None if it is not tracked"""
+        return None
+
+    def slot_overwritten(self, cursor):
+        """True if the slots last returned to the cursor have since been overwritten.
+
+        Consumers holding on to a zero-copy slot call this once they are done with it to
+        detect that the producer lapped them while they were reading.
+        """
+
+        with self._lock:
+            if cursor.detached:
+                return False
+
+            return not self._is_sequence_valid(cursor.last_sequence)
+
+    def read_next(self, cursor, timeout=None, copy=False):
+        """Return the next full slot for the cursor and advance it.
+
+        Blocks until the slot is sealed, returns None if the timeout expires first. The
+        slot is returned without copying unless copy is True, in which case the copy is
+        made after releasing the lock and checked against the producer afterwards.
+        """
+
+        while True:
+            with self._data_ready:
+                if not self._data_ready.wait_for(
+                    lambda: cursor.sequence < self._sequence, timeout
+                ):
+                    return None
+
+                if cursor.spill is not None and len(cursor.spill):
+                    sequence, data = cursor.spill.read()
+                    cursor.sequence = sequence + 1
+                    cursor.detached = True
+                    return self._deserialize_slot(data)
+
+                self._check_overrun(cursor)
+
+                sequence = cursor.sequence
+                cursor.sequence += 1
+                cursor.last_sequence = sequence
+                self._space_available.notify_all()
+
+                if not self._is_sequence_valid(sequence):
+                    # behind the in-memory window, read the copy from the overflow tier
+                    data = self._overflow.read(sequence)
+                    if data is None:
+                        cursor.dropped += 1
+                        continue
+
+                    cursor.detached = True
+                    return data
+
+                cursor.detached = False
+                data = self._read_slot(self.get_index(sequence))
+
+            if not copy:
+                return data
+
+            data = self._copy_slot(data)
+
+            with self._lock:
+                if self._is_sequence_valid(sequence):
+                    return data
+
+                # overwritten while copying, rewind so the overrun policy applies
+                cursor.sequence = sequence
+
+    def _join_slots(self, sequence, count):
+        """Contents of count slots starting at sequence as one chunk, and if it is a copy"""
+        data = self.get_empty()
+
+        for offset in range(count):
+            data += self._read_slot(self.get_index(sequence + offset))
+
+        return data, True
+
+    def read_available(self, cursor, max_slots=None, timeout=None, copy=False):
+        """Return every sealed slot from the cursor up to the newest as one chunk.
+
+        Works like read_next but drains up to max_slots slots under a single lock
+        acquisition, so a consumer that fell behind catches up in one call. Slots held in
+        the spill file or overflow tier are still returned one at a time.
+        """
+
+        while True:
+            with self._data_ready:
+                if not self._data_ready.wait_for(
+                    lambda: cursor.sequence < self._sequence, timeout
+                ):
+                    return None
+
+                spill_pending = cursor.spill is not None and len(cursor.spill)
+                if not spill_pending:
+                    self._check_overrun(cursor)
+
+                single = spill_pending or not self._is_sequence_valid(cursor.sequence)
+                if not single:
+                    sequence = cursor.sequence
+                    count = self._sequence - sequence
+                    if max_slots is not None:
+                        count = min(count, max_slots)
+
+                    data, cursor.detached = self._join_slots(sequence, count)
+                    cursor.sequence = sequence + count
+                    cursor.last_sequence = sequence
+                    self._space_available.notify_all()
+
+            if single:
+                return self.read_next(cursor, timeout=0, copy=copy)
+
+            if not copy or cursor.detached:
+                return data
+
+            data = self._copy_slot(data)
+
+            with self._lock:
+                if self._is_sequence_valid(sequence):
+                    return data
+
+                # overwritten while copying, rewind so the overrun policy applies
+                cursor.sequence = sequence
+
+    def get_stats(self):
+        with self._lock:
+            consumers = []
+            for cursor in self._cursors:
+                info = cursor.info()
+                info["lag"] = self._sequence - cursor.sequence
+                consumers.append(info)
+
+            stats = {
+                "num_buffers": self._num_buffers,
+                "buffer_size": self._maxsize,
+                "sequence": self._sequence,
+                "consumers": consumers,
+            }
+            stats.update(self._policy_stats)
+
+            if self._overflow is not None:
+                stats["overflow"] = self._overflow.get_stats()
+
+            return stats
 
     def reset_buffer(self):
-        for i in range(self._num_buffers):
-            self._data[i] = self.get_empty()
+        with self._data_ready:
+            for i in range(self._num_buffers):
+                self._clear_slot(i)
+
+            # emptied slots are not data loss, start every consumer from the next slot
+            for cursor in self._cursors:
+                cursor.sequence = self._sequence
+
+            self._data_ready.notify_all()
+            self._space_available.notify_all()
 
     def get_latest_buffer(self):
         latest_buffer = self._index - 1
@@ -94,3 +629,608 @@ class CircularBufferQueue(object):
 class CircularResultsBufferQueue(CircularBufferQueue):
     def get_empty(self):
         return []
+
+
+class PreallocatedCircularBufferQueue(CircularBufferQueue):
+    """Byte ring backed by a single preallocated bytearray of num_buffers * buffer_size.
+
+    Incoming packets are copied into place through a memoryview, so appending a packet
+    never reallocates the slot it lands in. Each slot only tracks how many of its bytes
+    are filled.
+    """
+
+    def __init__(
+        self,
+        lock,
+        num_buffers=256,
+        buffer_size=128,
+        block_timeout=1.0,
+        overflow_slots=0,
+        overflow_path=None,
+        sample_size=1,
+    ):
+        self._sample_size = sample_size
+
+        super(PreallocatedCircularBufferQueue, self).__init__(
+            lock,
+            num_buffers=num_buffers,
+            buffer_size=buffer_size,
+            block_timeout=block_timeout,
+        )
+
+        if overflow_slots:
+            self._overflow = MmapOverflowTier(
+                overflow_slots, buffer_size, path=overflow_path
+            )
+
+    def close(self):
+        if self._overflow is not None:
+            self._overflow.close()
+
+    def _init_storage(self):
+        self._storage = bytearray(self._num_buffers * self._maxsize)
+        self._view = memoryview(self._storage)
+        self._lengths = [0] * self._num_buffers
+        # monotonic time each slot was sealed, slots before _history_start were cleared
+        self._timestamps = [0.0] * self._num_buffers
+        self._history_start = 0
+
+    def describe_buffer_state(self):
+        print("max buffer size:", self._maxsize)
+        print("current index", self._index)
+        for i in range(self._num_buffers):
+            print(i, "len:", self._lengths[i])
+
+    def _clear_slot(self, index):
+        self._lengths[index] = 0
+
+    def _slot_length(self, index):
+        return self._lengths[index]
+
+    def _serialize_slot(self, data):
+        return data
+
+    def _deserialize_slot(self, data):
+        return data
+
+    def _slot_view(self, index):
+        start = index * self._maxsize
+        return self._view[start : start + self._lengths[index]]
+
+    def update_buffer(self, data):
+        with self._lock:
+            data = memoryview(data).cast("B")
+            remaining = len(data)
+
+            if self._drop_newest(remaining):
+                return
+
+            if (
+                self._lengths[self._index] + remaining
+                > self._num_buffers * self._maxsize
+            ):
+                print("Buffer Size is Too Small, Data is being overwritten!")
+
+            offset = 0
+            while remaining:
+                filled = self._lengths[self._index]
+                taken = min(self._maxsize - filled, remaining)
+                start = self._index * self._maxsize + filled
+
+                self._view[start : start + taken] = data[offset : offset + taken]
+                self._lengths[self._index] = filled + taken
+
+                offset += taken
+                remaining -= taken
+
+                if self.is_buffer_full(self._index):
+                    self._increment()
+
+    def is_buffer_full(self, index):
+        return self._lengths[index] == self._maxsize
+
+    def _increment(self):
+        self._timestamps[self._index] = time.monotonic()
+        super(PreallocatedCircularBufferQueue, self)._increment()
+
+    def reset_buffer(self):
+        super(PreallocatedCircularBufferQueue, self).reset_buffer()
+
+        with self._lock:
+            self._history_start = self._sequence
+
+    def slot_timestamp(self, sequence):
+        """monotonic time the slot holding sequence was sealed, None once it is overwritten"""
+        with self._lock:
+            if sequence >= self._sequence or not self._is_sequence_valid(sequence):
+                return None
+
+            return self._timestamps[self.get_index(sequence)]
+
+    def sample_index(self, sequence):
+        """running index of the first sample in the slot holding sequence"""
+        return sequence * self._maxsize // self._sample_size
+
+    def _bisect(self, timestamp, first, last, right=False):
+        """first sequence in [first, last) sealed after timestamp (at or after unless right)"""
+        while first < last:
+            middle = (first + last) // 2
+            sealed = self._timestamps[self.get_index(middle)]
+
+            if sealed < timestamp or (right and sealed == timestamp):
+                first = middle + 1
+            else:
+                last = middle
+
+        return first
+
+    def range(self, t0, t1):
+        """Copy of the slots sealed between the monotonic times t0 and t1.
+
+        Returns the running sample index of the first sample and the slots joined into
+        a single bytes object.
+        """
+
+        with self._lock:
+            first = max(self._oldest_memory_sequence(), self._history_start)
+            start = self._bisect(t0, first, self._sequence)
+            end = self._bisect(t1, start, self._sequence, right=True)
+
+            data, _ = self._join_slots(start, end - start)
+
+            return self.sample_index(start), bytes(data)
+
+    def snapshot(self, seconds):
+        """Copy of the slots sealed during the last seconds, see range"""
+        now = time.monotonic()
+
+        return self.range(now - seconds, now)
+
+    def _read_slot(self, index):
+        """Read-only view of the slot, valid until the producer laps it"""
+        return self._slot_view(index).toreadonly()
+
+    def _copy_slot(self, data):
+        return bytes(data)
+
+    def _join_slots(self, sequence, count):
+        """Slots are adjacent in storage, so the chunk is a view unless it wraps around"""
+        begin = self.get_index(sequence) * self._maxsize
+        size = count * self._maxsize
+
+        if begin + size <= len(self._storage):
+            return self._view[begin : begin + size].toreadonly(), False
+
+        wrapped = begin + size - len(self._storage)
+
+        return bytes(self._view[begin:]) + bytes(self._view[:wrapped]), True
+
+
+SHARED_MEMORY_MAGIC = b"OGSM"
+SHARED_MEMORY_VERSION = 1
+# magic, version, num_buffers, buffer_size, write sequence, metadata length
+SHARED_MEMORY_HEADER = struct.Struct("<4sIIIQI")
+SHARED_MEMORY_SEQUENCE_OFFSET = 16
+SHARED_MEMORY_HEADER_SIZE = 4096
+SHARED_MEMORY_POLL_INTERVAL = 0.001
+
+
+class SharedMemoryCircularBufferQueue(PreallocatedCircularBufferQueue):
+    """Preallocated byte ring whose slots live in a named multiprocessing shared memory block.
+
+    The block starts with a fixed header holding the ring geometry, the write sequence
+    and a JSON metadata document describing the samples, followed by the slots. Other
+    processes attach to it by name with SharedMemoryBufferReader.
+    """
+
+    def __init__(self, lock, name, num_buffers=256, buffer_size=128, **kwargs):
+        self._name = name
+
+        super(SharedMemoryCircularBufferQueue, self).__init__(
+            lock, num_buffers=num_buffers, buffer_size=buffer_size, **kwargs
+        )
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def _init_storage(self):
+        size = self._num_buffers * self._maxsize
+
+        try:
+            self._shm = shared_memory.SharedMemory(
+                name=self._name, create=True, size=SHARED_MEMORY_HEADER_SIZE + size
+            )
+        except FileExistsError:
+            # left behind by a previous connection that was never cleaned up
+            stale = shared_memory.SharedMemory(name=self._name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(
+                name=self._name, create=True, size=SHARED_MEMORY_HEADER_SIZE + size
+            )
+
+        self._storage = self._shm.buf[
+            SHARED_MEMORY_HEADER_SIZE : SHARED_MEMORY_HEADER_SIZE + size
+        ]
+        self._view = self._storage
+        self._lengths = [0] * self._num_buffers
+        self._timestamps = [0.0] * self._num_buffers
+        self._history_start = 0
+
+        self.set_metadata({})
+
+    def set_metadata(self, metadata):
+        """Publish the sample format and column map for attached readers"""
+
+        encoded = json.dumps(metadata).encode()
+
+        if SHARED_MEMORY_HEADER.size + len(encoded) > SHARED_MEMORY_HEADER_SIZE:
+            raise Exception("Shared memory metadata is too large")
+
+        with self._lock:
+            SHARED_MEMORY_HEADER.pack_into(
+                self._shm.buf,
+                0,
+                SHARED_MEMORY_MAGIC,
+                SHARED_MEMORY_VERSION,
+                self._num_buffers,
+                self._maxsize,
+                self._sequence,
+                len(encoded),
+            )
+            start = SHARED_MEMORY_HEADER.size
+            self._shm.buf[start : start + len(encoded)] = encoded
+
+    def _increment(self):
+        super(SharedMemoryCircularBufferQueue, self)._increment()
+
+        # the slot is sealed before readers can see the new sequence
+        struct.pack_into(
+            "<Q", self._shm.buf, SHARED_MEMORY_SEQUENCE_OFFSET, self._sequence
+        )
+
+    def get_stats(self):
+        stats = super(SharedMemoryCircularBufferQueue, self).get_stats()
+        stats["shared_memory_name"] = self.name
+
+        return stats
+
+    def close(self):
+        super(SharedMemoryCircularBufferQueue, self).close()
+
+        # unlink first, in-process consumers may still hold views that keep it mapped
+        self._shm.unlink()
+
+        try:
+            self._storage.release()
+            self._shm.close()
+        except BufferError:
+            pass
+
+
+class SharedMemoryBufferReader(object):
+    """Attach to a SharedMemoryCircularBufferQueue from another process.
+
+    read_next returns read-only views straight into the shared slots, call
+    slot_overwritten after using one to check the producer did not lap the reader.
+    """
+
+    def __init__(self, name, on_overrun=OVERRUN_SKIP):
+        self._shm = shared_memory.SharedMemory(name=name)
+        # the producer owns the block, do not let this process' tracker unlink it
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        (
+            magic,
+            version,
+            self.num_buffers,
+            self.buffer_size,
+            sequence,
+            length,
+        ) = SHARED_MEMORY_HEADER.unpack_from(self._shm.buf, 0)
+
+        if magic != SHARED_MEMORY_MAGIC or version != SHARED_MEMORY_VERSION:
+            raise Exception("{} is not an Open Gateway buffer".format(name))
+
+        start = SHARED_MEMORY_HEADER.size
+        self.metadata = json.loads(bytes(self._shm.buf[start : start + length]))
+
+        size = self.num_buffers * self.buffer_size
+        self._view = self._shm.buf[
+            SHARED_MEMORY_HEADER_SIZE : SHARED_MEMORY_HEADER_SIZE + size
+        ].toreadonly()
+
+        self.on_overrun = on_overrun
+        self.sequence = max(sequence - 1, 0)
+        self.dropped = 0
+        self.overruns = 0
+
+    @property
+    def write_sequence(self):
+        return struct.unpack_from("<Q", self._shm.buf, SHARED_MEMORY_SEQUENCE_OFFSET)[0]
+
+    def _oldest_sequence(self, write_sequence):
+        return max(write_sequence - self.num_buffers + 1, 0)
+
+    def read_next(self, timeout=None):
+        """Return a view of the next sealed slot, None if the timeout expires first"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            write_sequence = self.write_sequence
+
+            if self.sequence < write_sequence:
+                break
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+            time.sleep(SHARED_MEMORY_POLL_INTERVAL)
+
+        oldest = self._oldest_sequence(write_sequence)
+
+        if self.sequence < oldest:
+            self.overruns += 1
+
+            if self.on_overrun == OVERRUN_RAISE:
+                self.dropped += oldest - self.sequence
+                self.sequence = oldest
+                raise BufferOverrunException(
+                    "Shared memory reader fell behind the producer"
+                )
+
+            self.dropped += write_sequence - 1 - self.sequence
+            self.sequence = write_sequence - 1
+
+        start = (self.sequence % self.num_buffers) * self.buffer_size
+        self.sequence += 1
+
+        return self._view[start : start + self.buffer_size]
+
+    def slot_overwritten(self):
+        """True if the slot last returned by read_next has since been overwritten"""
+        return self.sequence - 1 < self._oldest_sequence(self.write_sequence)
+
+    def as_array(self, data):
+        """View a slot as a (samples, data_width) array using the published format"""
+        return np.frombuffer(data, dtype=self.metadata["dtype"]).reshape(
+            -1, self.metadata["data_width"]
+        )
+
+    def close(self):
+        try:
+            self._view.release()
+            self._shm.close()
+        except BufferError:
+            # views returned by read_next are still alive, the mapping goes with them
+            pass
+
+
+class CircularSampleBufferQueue(object):
+    """Ring of decoded samples stored in a (capacity_samples, data_width) NumPy array
+
+    Producers append whole packets of raw bytes which are decoded once with the reader's
+    data type. Consumers register a cursor whose sequence is the running index of the
+    next sample they will read and get back read-only views into the ring, so the
+    struct decoding is not repeated for every consumer.
+    """
+
+    def __init__(
+        self, lock, capacity_samples, data_width, dtype="<i2", block_timeout=1.0
+    ):
+        self._lock = lock
+        self._data_ready = threading.Condition(lock)
+        self._space_available = threading.Condition(lock)
+        self._block_timeout = block_timeout
+        self._policy_stats = {
+            "dropped_newest_packets": 0,
+            "dropped_newest_samples": 0,
+            "block_waits": 0,
+            "block_timeouts": 0,
+            "blocked_seconds": 0.0,
+        }
+        self._capacity = capacity_samples
+        self._data_width = data_width
+        self._dtype = np.dtype(dtype)
+        self._samples = np.zeros((capacity_samples, data_width), dtype=self._dtype)
+        self._sample_count = 0
+        self._last_packet_start = 0
+        self._remainder = b""
+        self._cursors = []
+
+    @property
+    def sample_size(self):
+        return self._data_width * self._dtype.itemsize
+
+    def decode(self, data):
+        """Decode raw bytes into a (samples, data_width) array without copying"""
+        return np.frombuffer(data, dtype=self._dtype).reshape(-1, self._data_width)
+
+    def update_buffer(self, data):
+        """Append a packet of raw bytes and return it decoded as a (samples, data_width) array"""
+
+        if self._remainder:
+            data = self._remainder + bytes(data)
+            self._remainder = b""
+
+        usable = len(data) - len(data) % self.sample_size
+        if usable != len(data):
+            self._remainder = bytes(data[usable:])
+
+        samples = self.decode(memoryview(data)[:usable])
+
+        with self._lock:
+            if self._apply_backpressure(len(samples)):
+                return samples
+
+            # a packet larger than the ring only keeps its newest samples
+            stored = samples
+            if len(stored) > self._capacity:
+                self._sample_count += len(stored) - self._capacity
+                stored = stored[-self._capacity :]
+
+            start = self._sample_count % self._capacity
+            first = min(len(stored), self._capacity - start)
+
+            self._samples[start : start + first] = stored[:first]
+            self._samples[: len(stored) - first] = stored[first:]
+
+            self._last_packet_start = self._sample_count
+            self._sample_count += len(stored)
+
+            self._data_ready.notify_all()
+
+        return samples
+
+    def _apply_backpressure(self, num_samples):
+        """Wait for blocking consumers, returns True if the packet should be dropped"""
+
+        # every consumer must have read up to here before the packet can be stored
+        required = self._sample_count + num_samples - self._capacity
+
+        for cursor in self._cursors:
+            if cursor.policy == POLICY_DROP_NEWEST and cursor.sequence < required:
+                self._policy_stats["dropped_newest_packets"] += 1
+                self._policy_stats["dropped_newest_samples"] += num_samples
+                return True
+
+        def blocking_cursors_done():
+            return all(
+                cursor.sequence >= required
+                for cursor in self._cursors
+                if cursor.policy == POLICY_BLOCK
+            )
+
+        if not blocking_cursors_done():
+            self._policy_stats["block_waits"] += 1
+            start = time.time()
+            if not self._space_available.wait_for(
+                blocking_cursors_done, self._block_timeout
+            ):
+                self._policy_stats["block_timeouts"] += 1
+            self._policy_stats["blocked_seconds"] += time.time() - start
+
+        return False
+
+    def register_cursor(
+        self, on_overrun=OVERRUN_SKIP, name=None, policy=POLICY_DROP_OLDEST
+    ):
+        """Register a consumer starting at the most recent packet, the spill policy is
+        not supported on decoded samples"""
+
+        if policy == POLICY_SPILL:
+            raise Exception("The sample buffer does not support the spill policy.")
+
+        with self._lock:
+            cursor = BufferCursor(
+                self._last_packet_start,
+                on_overrun=on_overrun,
+                name=name,
+                policy=policy,
+            )
+            self._cursors.append(cursor)
+
+            return cursor
+
+    def unregister_cursor(self, cursor):
+        with self._lock:
+            if cursor in self._cursors:
+                self._cursors.remove(cursor)
+                self._space_available.notify_all()
+
+    def _oldest_sample(self):
+        return max(self._sample_count - self._capacity, 0)
+
+    def _check_overrun(self, cursor):
+        oldest = self._oldest_sample()
+
+        if cursor.sequence >= oldest:
+            return
+
+        cursor.overruns += 1
+
+        if cursor.on_overrun == OVERRUN_RAISE:
+            missed = oldest - cursor.sequence
+            cursor.dropped += missed
+            cursor.sequence = oldest
+            raise BufferOverrunException(
+                "Consumer {} fell behind the producer, {} samples were overwritten".format(
+                    cursor.name, missed
+                )
+            )
+
+        cursor.dropped += self._last_packet_start - cursor.sequence
+        cursor.sequence = self._last_packet_start
+
+    def read_next(self, cursor, max_samples=None, timeout=None, copy=False):
+        """Return a read-only view of the samples available to the cursor and advance it.
+
+        The view stops at the end of the ring, the remaining samples are returned by the
+        next call. Returns None if no samples arrive before the timeout. The view is only
+        valid until the producer laps it, with copy the samples are copied and checked
+        against the producer afterwards like CircularBufferQueue.read_next does.
+        """
+
+        while True:
+            with self._data_ready:
+                if not self._data_ready.wait_for(
+                    lambda: cursor.sequence < self._sample_count, timeout
+                ):
+                    return None
+
+                self._check_overrun(cursor)
+
+                sequence = cursor.sequence
+                start = sequence % self._capacity
+                count = min(self._sample_count - sequence, self._capacity - start)
+                if max_samples is not None:
+                    count = min(count, max_samples)
+
+                samples = self._samples[start : start + count]
+                samples.flags.writeable = False
+                cursor.sequence += count
+                self._space_available.notify_all()
+
+            if not copy:
+                return samples
+
+            samples = samples.copy()
+
+            with self._lock:
+                if sequence >= self._oldest_sample():
+                    return samples
+
+                # overwritten while copying, rewind so the overrun policy applies
+                cursor.sequence = sequence
+
+    def get_stats(self):
+        with self._lock:
+            consumers = []
+            for cursor in self._cursors:
+                info = cursor.info()
+                info["lag"] = self._sample_count - cursor.sequence
+                consumers.append(info)
+
+            stats = {
+                "capacity_samples": self._capacity,
+                "data_width": self._data_width,
+                "dtype": self._dtype.str,
+                "sample_count": self._sample_count,
+                "consumers": consumers,
+            }
+            stats.update(self._policy_stats)
+
+            return stats
+
+    def reset_buffer(self):
+        with self._data_ready:
+            self._remainder = b""
+            self._last_packet_start = self._sample_count
+
+            for cursor in self._cursors:
+                cursor.sequence = self._sample_count
+
+            self._data_ready.notify_all()
+            self._space_available.notify_all()
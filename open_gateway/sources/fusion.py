@@ -6,16 +6,130 @@ import struct
 import time
 import csv
 import os
+import numpy as np
 from open_gateway.sources.base import (
     BaseReader,
     BaseStreamReaderMixin,
     BaseResultReaderMixin,
+    BUFFER_WAIT_TIMEOUT,
 )
 
 from open_gateway.sources.buffers import (
     CircularBufferQueue,
     CircularResultsBufferQueue,
+    BufferReadySignal,
+    BufferOverrunException,
+    OVERRUN_SKIP,
+    OVERRUN_RAISE,
+    POLICY_SPILL,
 )
+from open_gateway.sources.resample import (
+    ClockDriftEstimator,
+    SourceResampler,
+    promote_data_type,
+    encode_samples,
+)
+
+# fuse slot by slot, every source must stream at the same rate
+FUSION_MODE_INTERLEAVE = "interleave"
+# timestamp every source and resample them onto a common rate
+FUSION_MODE_RESAMPLE = "resample"
+
+# wait for a silent source for as long as it takes
+SILENT_SOURCE_STALL = "stall"
+# after the timeout, emit the packet holding the last sample of the silent source
+SILENT_SOURCE_GAP_FILL = "gap-fill"
+
+
+class SourceActivity(object):
+    """When a fused source last delivered a slot and what its silences cost"""
+
+    def __init__(self):
+        self.last_slot = time.monotonic()
+        self.filling = False
+        self.stalling = False
+        self.gaps = 0
+        self.gap_filled_samples = 0
+        self.stalls = 0
+
+    def silent_for(self, now):
+        return now - self.last_slot
+
+    def delivered(self):
+        self.last_slot = time.monotonic()
+        self.filling = False
+        self.stalling = False
+
+    def fill(self, samples):
+        if not self.filling:
+            self.filling = True
+            self.gaps += 1
+
+        self.gap_filled_samples += samples
+
+    def stall(self):
+        if not self.stalling:
+            self.stalling = True
+            self.stalls += 1
+
+    def get_stats(self):
+        return {
+            "silent_seconds": self.silent_for(time.monotonic()),
+            "filling": self.filling,
+            "stalling": self.stalling,
+            "gaps": self.gaps,
+            "gap_filled_samples": self.gap_filled_samples,
+            "stalls": self.stalls,
+        }
+
+
+class SourceAlignment(object):
+    """Sample clock of a source fused slot by slot and the corrections keeping it aligned.
+
+    samples counts the samples read from the source and next_index is the source's
+    index of the next sample going into a fused packet. error is the time between that
+    sample and the reference source's next sample, as of the last packet.
+    """
+
+    def __init__(self, sample_rate):
+        self.clock = ClockDriftEstimator(sample_rate)
+        self.samples = 0
+        self.next_index = 0
+        self.sequence = None
+        self.inserted = 0
+        self.removed = 0
+        self.error = 0.0
+        self.max_error = 0.0
+
+    def add_slot(self, count, sealed_at, sequence=None):
+        """Count a slot of count samples, a gap in sequence restarts the clock fit"""
+        if (
+            sequence is not None
+            and self.sequence is not None
+            and sequence != self.sequence + 1
+        ):
+            self.clock.reset()
+
+        self.sequence = sequence
+        self.samples += count
+        self.clock.add(self.samples - 1, sealed_at)
+
+    def record_error(self, error):
+        self.error = error
+        self.max_error = max(self.max_error, abs(error))
+
+    def get_stats(self):
+        stats = self.clock.get_stats()
+        stats.update(
+            {
+                "inserted_samples": self.inserted,
+                "removed_samples": self.removed,
+                "alignment_error_ms": self.error * 1000.0,
+                "max_alignment_error_ms": self.max_error * 1000.0,
+            }
+        )
+
+        return stats
 
 
 class BaseFusionReader(BaseReader):
@@ -30,6 +144,38 @@ class BaseFusionReader(BaseReader):
         self.source_samples_per_packet = 1
         self.recording = False
         self._record_thread = None
+        self.sbuffer = None
+        self.record_backpressure_policy = config.get(
+            "RECORD_BACKPRESSURE_POLICY", POLICY_SPILL
+        )
+        self.fusion_mode = config.get("FUSION_MODE", FUSION_MODE_INTERLEAVE)
+        self.fusion_sample_rate = config.get("FUSION_SAMPLE_RATE", None)
+        self.silent_source_policy = config.get(
+            "FUSION_SILENT_SOURCE_POLICY", SILENT_SOURCE_STALL
+        )
+        self.silent_source_timeout = config.get("FUSION_SILENT_SOURCE_TIMEOUT", 1.0)
+        # state of every open read_data generator, published for get_stats
+        self._consumers = {}
+        # knowledge packs run on the fused sources, not on the fused stream
+        self.inference_workers = []
+
+        if self.fusion_mode not in (FUSION_MODE_INTERLEAVE, FUSION_MODE_RESAMPLE):
+            raise Exception("Unknown fusion mode {}".format(self.fusion_mode))
+
+        if self.silent_source_policy not in (
+            SILENT_SOURCE_STALL,
+            SILENT_SOURCE_GAP_FILL,
+        ):
+            raise Exception(
+                "Unknown silent source policy {}".format(self.silent_source_policy)
+            )
+
+        if config.get("SHARED_MEMORY_NAME"):
+            # every source publishes its own ring
+            for index, source in enumerate(self.sources):
+                source.shared_memory_name = "{}-{}".format(
+                    config["SHARED_MEMORY_NAME"], index
+                )
 
     @property
     def num_sources(self):
@@ -42,9 +188,15 @@ class BaseFusionReader(BaseReader):
     def is_recording(self):
         return self.recording
 
-    def connect(self):
+    def connect(self, backpressure_policy=None, record_backpressure_policy=None):
+        if record_backpressure_policy is not None:
+            self.record_backpressure_policy = record_backpressure_policy
+
         for source in self.sources:
-            source.connect()
+            source.connect(
+                backpressure_policy=backpressure_policy,
+                record_backpressure_policy=record_backpressure_policy,
+            )
 
     def disconnect(self):
         for source in self.sources:
@@ -60,28 +212,138 @@ class BaseFusionReader(BaseReader):
     def is_streaming(self):
         return self._check_streaming()
 
-    def is_data_ready(self, data_ready):
-        for data in data_ready:
-            if not data:
-                return False
+    def get_buffer_geometry(self):
+        return {"sources": [source.get_buffer_geometry() for source in self.sources]}
+
+    def get_stats(self):
+        stats = {
+            "streaming": self.is_streaming(),
+            "recording": self.is_recording(),
+            "fusion_mode": self.fusion_mode,
+            "sources": [source.get_stats() for source in self.sources],
+        }
+
+        consumers = {}
+        for key, state in list(self._consumers.items()):
+            consumers[key] = {
+                "wait": {
+                    "silent_source_policy": self.silent_source_policy,
+                    "silent_source_timeout": self.silent_source_timeout,
+                    "sources": [activity.get_stats() for activity in state["activity"]],
+                }
+            }
+
+            if state.get("alignment") is not None:
+                consumers[key]["alignment"] = {
+                    "reference": self.sources[0].device_id,
+                    "sources": [
+                        alignment.get_stats() for alignment in state["alignment"]
+                    ],
+                }
 
-        return True
+            if state.get("resamplers") is not None:
+                consumers[key]["resample"] = {
+                    "sample_rate": self.sample_rate,
+                    "data_type": self.data_type,
+                    "sources": [
+                        resampler.get_stats() for resampler in state["resamplers"]
+                    ],
+                }
 
-    def _check_is_stream_source_ready(self, bindex):
-        for index, source in enumerate(self.sources):
-            bindex[index] = source.buffer.get_latest_buffer()
-            if bindex[index] is None:
-                return False
+        stats["consumers"] = consumers
 
-        return True
+        return stats
 
-    def _check_is_result_source_ready(self, bindex):
-        for index, source in enumerate(self.sources):
-            bindex[index] = source.rbuffer.get_latest_buffer()
-            if bindex[index] is None:
-                return False
+    def _add_consumer(self, name, state):
+        """Publish the state of a read_data generator, returns the key it is listed under"""
+        key = name
+        count = 1
+        while key in self._consumers:
+            count += 1
+            key = "{}-{}".format(name, count)
 
-        return True
+        self._consumers[key] = state
+
+        return key
+
+    def _remove_consumer(self, key):
+        self._consumers.pop(key, None)
+
+    def _register_cursors(self, buffers, name, on_overrun=OVERRUN_SKIP, policy=None):
+        return [
+            buffer.register_cursor(
+                on_overrun=on_overrun,
+                name=name,
+                policy=policy if policy is not None else source.backpressure_policy,
+            )
+            for buffer, source in zip(buffers, self.sources)
+        ]
+
+    def _unregister_cursors(self, buffers, cursors):
+        for buffer, cursor in zip(buffers, cursors):
+            buffer.unregister_cursor(cursor)
+
+    def _add_listener(self, buffers):
+        """One signal woken by every buffer, so all sources are waited on at once"""
+        signal = BufferReadySignal()
+        for buffer in buffers:
+            buffer.add_listener(signal)
+
+        return signal
+
+    def _remove_listener(self, buffers, signal):
+        for buffer in buffers:
+            buffer.remove_listener(signal)
+
+    def _read_slot(self, buffer, cursor):
+        """Next slot of a source without waiting, a reported overrun is logged and the
+        read continues from the oldest slot, the gap in sequence restarts its timeline
+        """
+        while True:
+            try:
+                return buffer.read_next(cursor, timeout=0)
+            except BufferOverrunException as e:
+                print("Fusion: fell behind a source!", e)
+
+    def _gap_fill_due(self, activity, missing, can_fill=True):
+        """True if the packet should be emitted without the missing sources.
+
+        Only with the gap-fill policy, once every missing source has been silent for
+        the timeout. With the stall policy the silent sources are counted as stalling.
+        activity holds the SourceActivity of every source for the calling generator.
+        """
+
+        now = time.monotonic()
+        silent = [
+            index
+            for index in missing
+            if activity[index].silent_for(now) >= self.silent_source_timeout
+        ]
+
+        if self.silent_source_policy == SILENT_SOURCE_STALL:
+            for index in silent:
+                if not activity[index].stalling:
+                    print(
+                        "Fusion: waiting on silent source",
+                        self.sources[index].device_id,
+                    )
+                activity[index].stall()
+            return False
+
+        return can_fill and len(silent) == len(missing)
+
+    def _wait_timeout(self, activity, missing):
+        """How long to wait for a slot before checking the silent sources again"""
+        if self.silent_source_policy != SILENT_SOURCE_GAP_FILL:
+            return BUFFER_WAIT_TIMEOUT
+
+        now = time.monotonic()
+        remaining = max(
+            self.silent_source_timeout - activity[index].silent_for(now)
+            for index in missing
+        )
+
+        return min(max(remaining, 0.001), BUFFER_WAIT_TIMEOUT)
 
 
 class FusionStreamReader(BaseFusionReader, BaseStreamReaderMixin):
@@ -109,19 +371,37 @@ class FusionStreamReader(BaseFusionReader, BaseStreamReaderMixin):
                 }
             )
 
-        if len(sample_rates) != 1:
-            raise Exception("All sources must have the same sample rate.")
+        if self.fusion_mode == FUSION_MODE_RESAMPLE:
+            # a fused packet spans about as long as the longest source slot
+            config["sample_rate"] = self.fusion_sample_rate or max(sample_rates)
+            config["samples_per_packet"] = max(
+                int(
+                    round(
+                        config["sample_rate"]
+                        * max(
+                            source.slot_samples / float(source.sample_rate)
+                            for source in self.sources
+                        )
+                    )
+                ),
+                1,
+            )
+            config["data_type"] = promote_data_type(data_type)
+        else:
+            if len(sample_rates) != 1:
+                raise Exception("All sources must have the same sample rate.")
+
+            if len(samples_per_packet) != 1:
+                raise Exception("All sources must have the same samples per packet.")
 
-        if len(samples_per_packet) != 1:
-            raise Exception("All sources must have the same samples per packet.")
+            if len(data_type) != 1:
+                raise Exception("All sources must have the same data type.")
 
-        if len(data_type) != 1:
-            raise Exception("All sources must have the same data type.")
+            config["sample_rate"] = sample_rates.pop()
+            config["samples_per_packet"] = combined_samples_per_packet
+            config["data_type"] = data_type.pop()
 
-        config["sample_rate"] = sample_rates.pop()
-        config["samples_per_packet"] = combined_samples_per_packet
         config["column_location"] = combined_config_columns
-        config["data_type"] = data_type.pop()
 
         self.source_samples_per_packet = config["samples_per_packet"]
         self.sample_rate = config["sample_rate"]
@@ -130,52 +410,289 @@ class FusionStreamReader(BaseFusionReader, BaseStreamReaderMixin):
 
         return config
 
-    def read_data(self):
-        def inerleave_buffers(data_buffers):
-            packet_buffer = b""
-
-            getting_packets = True
-
-            while getting_packets:
-                for index, packet in enumerate(data_buffers):
-                    tmp = next(packet)
-
-                    if tmp:
-                        packet_buffer += tmp
+    def read_data(self, on_overrun=OVERRUN_SKIP, name="fusion", policy=None):
+        if self.fusion_mode == FUSION_MODE_RESAMPLE:
+            return self._read_resampled_data(on_overrun, name, policy)
+
+        return self._read_interleaved_data(on_overrun, name, policy)
+
+    def _read_resampled_data(self, on_overrun, name, policy):
+        """Fused packets of source_samples_per_packet frames at the fused sample rate.
+
+        Each source is read until it has samples past the last frame of the packet,
+        then every source is resampled onto the frame times and the columns are
+        joined in source order.
+        """
+
+        buffers = [source.buffer for source in self.sources]
+        cursors = self._register_cursors(
+            buffers, name, on_overrun=on_overrun, policy=policy
+        )
+        signal = self._add_listener(buffers)
+        activity = [SourceActivity() for _ in self.sources]
+        resamplers = [
+            SourceResampler(source.sample_rate, source.data_width, self.sample_rate)
+            for source in self.sources
+        ]
+        consumer = self._add_consumer(
+            name, {"activity": activity, "resamplers": resamplers}
+        )
+        offsets = np.arange(self.source_samples_per_packet) / float(self.sample_rate)
+        next_time = None
+
+        try:
+            while self.is_streaming():
+                version = signal.version
+                last_time = next_time + offsets[-1] if next_time is not None else None
+
+                for index, resampler in enumerate(resamplers):
+                    # drain the backlog of the source up to the packet before waiting,
+                    # a consumer that fell behind catches up without a wake per slot
+                    while not resampler.covers(last_time):
+                        data = self._read_slot(buffers[index], cursors[index])
+                        if data is None:
+                            break
+
+                        sequence = cursors[index].last_sequence
+                        sealed_at = buffers[index].slot_timestamp(sequence)
+                        samples = np.array(self.sources[index].decode_samples(data))
+
+                        if buffers[index].slot_overwritten(cursors[index]):
+                            # torn copy, the gap in sequence restarts the source timeline
+                            continue
+
+                        if activity[index].filling:
+                            # the samples held over the silence are not on the timeline
+                            resampler.resync()
+                        activity[index].delivered()
+
+                        resampler.add(
+                            samples,
+                            sealed_at if sealed_at is not None else time.monotonic(),
+                            sequence=None if cursors[index].detached else sequence,
+                        )
+
+                if next_time is None:
+                    if all(resampler.started for resampler in resamplers):
+                        next_time = max(
+                            resampler.start_time for resampler in resamplers
+                        )
                     else:
-                        getting_packets = False
+                        signal.wait(version, BUFFER_WAIT_TIMEOUT)
+                    continue
+
+                missing = [
+                    index
+                    for index, resampler in enumerate(resamplers)
+                    if not resampler.covers(last_time)
+                ]
+
+                if missing:
+                    # a silent source holds its last sample, which needs a timeline
+                    if not self._gap_fill_due(
+                        activity,
+                        missing,
+                        can_fill=all(resamplers[i].started for i in missing),
+                    ):
+                        signal.wait(version, self._wait_timeout(activity, missing))
+                        continue
+
+                    for index in missing:
+                        activity[index].fill(len(offsets))
+
+                times = next_time + offsets
+                frames = np.hstack(
+                    [resampler.resample(times) for resampler in resamplers]
+                )
+                next_time += len(offsets) / float(self.sample_rate)
+
+                yield encode_samples(frames, self.data_type)
+        finally:
+            self._remove_consumer(consumer)
+            self._remove_listener(buffers, signal)
+            self._unregister_cursors(buffers, cursors)
 
-            return packet_buffer
+        print("stream ended")
+        yield None
 
-        bindex = [False for _ in range(len(self.sources))]
-        data = [[] for _ in range(self.num_sources)]
-        data_ready = [False] * self.num_sources
+    def _read_interleaved_data(self, on_overrun, name, policy):
+        """Fused packets pairing the sources slot by slot.
+
+        Each slot is viewed as a (samples, data_width) array and the sources are
+        joined column wise in one step. When the sources hand over a different number
+        of samples, the packet holds as many as the shortest and the rest is carried
+        over to the next one.
+
+        The sample clock of every source is fitted to the times its slots arrive. When
+        a source drifts more than a sample away from the first source, one sample is
+        repeated or dropped from it in the next packet, see _align_sources.
+        """
+
+        buffers = [source.buffer for source in self.sources]
+        cursors = self._register_cursors(
+            buffers, name, on_overrun=on_overrun, policy=policy
+        )
+        signal = self._add_listener(buffers)
+        activity = [SourceActivity() for _ in self.sources]
+        alignment = [SourceAlignment(source.sample_rate) for source in self.sources]
+        consumer = self._add_consumer(
+            name, {"activity": activity, "alignment": alignment}
+        )
+        data = [None] * self.num_sources
+        # sources whose samples are still views of their slot
+        in_place = [False] * self.num_sources
+        # last sample of every source, held while it is silent
+        held = [
+            np.zeros(source.data_width, dtype=source.data_type_numpy)
+            for source in self.sources
+        ]
+
+        try:
+            while self.is_streaming():
+                version = signal.version
+
+                for index, source in enumerate(self.sources):
+                    if data[index] is None:
+                        slot = self._read_slot(buffers[index], cursors[index])
+                        if slot is not None:
+                            data[index] = source.decode_samples(slot)
+                            in_place[index] = True
+                            self._add_slot(
+                                alignment,
+                                activity,
+                                index,
+                                buffers[index],
+                                cursors[index],
+                                len(data[index]),
+                            )
 
-        while self.is_streaming():
-            if self._check_is_stream_source_ready(bindex):
-                break
-            time.sleep(0.01)
+                missing = [
+                    index for index, samples in enumerate(data) if samples is None
+                ]
 
-        while self.is_streaming():
-            for index, source in enumerate(self.sources):
-                if not data_ready[index] and source.buffer.is_buffer_full(
-                    bindex[index]
-                ):
-                    data[index] = source.buffer.get_buffer_iterator(
-                        bindex[index], source.data_width
-                    )
-                    data_ready[index] = True
-                    bindex[index] = source.buffer.get_next_index(bindex[index])
+                if missing:
+                    # wake as soon as any source seals a slot, until the last one does
+                    if not self._gap_fill_due(
+                        activity, missing, can_fill=len(missing) < self.num_sources
+                    ):
+                        signal.wait(version, self._wait_timeout(activity, missing))
+                        continue
 
-                if self.is_data_ready(data_ready):
-                    yield inerleave_buffers(data)
-                    data_ready = [False] * self.num_sources
+                    frames = min(
+                        len(samples) for samples in data if samples is not None
+                    )
+                    for index in missing:
+                        data[index] = np.tile(held[index], (frames, 1))
+                        activity[index].fill(frames)
+
+                self._align_sources(alignment, data, held, missing)
+
+                frames = min(len(samples) for samples in data)
+                packet = np.hstack([samples[:frames] for samples in data]).tobytes()
+
+                # the slots are read in place, drop the packet if any source lapped us
+                # while joining them
+                overwritten = any(
+                    buffers[index].slot_overwritten(cursors[index])
+                    for index in range(self.num_sources)
+                    if in_place[index]
+                )
+
+                for index, samples in enumerate(data):
+                    if index not in missing:
+                        held[index] = np.array(samples[frames - 1])
+                        alignment[index].next_index += frames
+
+                # keep a copy of the samples a longer source has left over
+                data = [
+                    (
+                        np.array(samples[frames:])
+                        if len(samples) > frames and index not in missing
+                        else None
+                    )
+                    for index, samples in enumerate(data)
+                ]
+                in_place = [False] * self.num_sources
 
-            time.sleep(0.001)
+                if not overwritten:
+                    yield packet
+        finally:
+            self._remove_consumer(consumer)
+            self._remove_listener(buffers, signal)
+            self._unregister_cursors(buffers, cursors)
 
         print("stream ended")
         yield None
 
+    def _record_packets(self, datawriter):
+        # one fused generator for the whole recording, overruns are handled per source
+        data_reader = self.read_data(
+            on_overrun=OVERRUN_RAISE,
+            name="recorder",
+            policy=self.record_backpressure_policy,
+        )
+
+        try:
+            while self.recording:
+                data = next(data_reader)
+
+                if data:
+                    self._write_packet_rows(datawriter, data)
+        finally:
+            data_reader.close()
+
+    def _add_slot(self, alignments, activity, index, buffer, cursor, count):
+        """Feed the slot just read for the source at index to its clock fit"""
+        alignment = alignments[index]
+        sealed_at = buffer.slot_timestamp(cursor.last_sequence)
+
+        if activity[index].filling:
+            # samples were held in place of the silent source, start a new fit
+            alignment.clock.reset()
+        activity[index].delivered()
+
+        alignment.next_index = alignment.samples
+        alignment.add_slot(
+            count,
+            sealed_at if sealed_at is not None else time.monotonic(),
+            sequence=None if cursor.detached else cursor.last_sequence,
+        )
+
+    def _align_sources(self, alignments, data, held, missing):
+        """Repeat or drop a sample of every source that drifted from the first source.
+
+        A source whose next sample was taken more than a sample period after the
+        reference's gets its last sample repeated, one taken more than a period before
+        it loses that sample. At most one sample per source is corrected per packet.
+        """
+
+        reference = alignments[0]
+        if 0 in missing or not reference.clock.ready:
+            return
+
+        reference_time = reference.clock.time(reference.next_index)
+
+        for index in range(1, self.num_sources):
+            alignment = alignments[index]
+            if index in missing or not alignment.clock.ready:
+                continue
+
+            error = alignment.clock.time(alignment.next_index) - reference_time
+            period = alignment.clock.period
+
+            if error > period:
+                data[index] = np.vstack((held[index][np.newaxis], data[index]))
+                alignment.next_index -= 1
+                alignment.inserted += 1
+                error -= period
+            elif error < -period and len(data[index]) > 1:
+                data[index] = data[index][1:]
+                alignment.next_index += 1
+                alignment.removed += 1
+                error += period
+
+            alignment.record_error(error)
+
 
 class FusionResultReader(BaseFusionReader, BaseResultReaderMixin):
     def set_app_config(self, config):
@@ -183,36 +700,36 @@ class FusionResultReader(BaseFusionReader, BaseResultReaderMixin):
         config["DEVICE_ID"] = self.device_id
 
     def read_data(self):
-        bindex = [False for _ in range(len(self.sources))]
-        data = [[] for _ in range(self.num_sources)]
-        data_ready = [False] * self.num_sources
+        rbuffers = [source.rbuffer for source in self.sources]
+        cursors = self._register_cursors(rbuffers, "fusion results")
+        signal = self._add_listener(rbuffers)
 
-        while self.is_streaming():
-            if self._check_is_result_source_ready(bindex):
-                break
-            time.sleep(0.01)
+        try:
+            while self.is_streaming():
+                version = signal.version
+                received = False
 
-        while self.is_streaming():
-            for index, source in enumerate(self.sources):
-                if source.rbuffer.is_buffer_full(bindex[index]):
-                    data[index] = source.rbuffer.read_buffer(bindex[index])
-                    bindex[index] = source.rbuffer.get_next_index(bindex[index])
-                    data_ready[index] = True
-
-            for index, is_datain_ready in enumerate(data_ready):
-                if is_datain_ready:
-                    for result in data[index]:
+                for index, source in enumerate(self.sources):
+                    data = rbuffers[index].read_next(cursors[index], timeout=0)
+
+                    if data is None:
+                        continue
+
+                    received = True
+
+                    for result in data:
                         if self._validate_results_data(result):
-                            result = self.sources[index]._map_classification(
-                                json.loads(result)
-                            )
+                            result = source._map_classification(json.loads(result))
                             result["timestamp"] = time.time()
-                            result["source"] = self.sources[index].device_id
-                            result["name"] = self.sources[index].name
+                            result["source"] = source.device_id
+                            result["name"] = source.name
                             yield json.dumps(result) + "\n"
-                    data_ready[index] = False
 
-            time.sleep(0.001)
+                if not received:
+                    signal.wait(version, BUFFER_WAIT_TIMEOUT)
+        finally:
+            self._remove_listener(rbuffers, signal)
+            self._unregister_cursors(rbuffers, cursors)
 
         print("stream ended")
         yield None
@@ -0,0 +1,325 @@
+import os
+import atexit
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+from open_gateway.sources.utils.sml_emulator import is_emulator_path
+
+INFERENCE_QUEUE_SIZE = 64
+INFERENCE_QUEUE_TIMEOUT = 0.5
+
+SWAP_LOADING = "loading"
+SWAP_READY = "ready"
+SWAP_DONE = "swapped"
+SWAP_FAILED = "failed"
+
+# folders made by stage_knowledge_pack that have not been released yet
+_staged_paths = set()
+
+
+def stage_knowledge_pack(sml_library_path):
+    """Copy the libsensiml in sml_library_path to a new folder and return it.
+
+    A library is only loaded once per path by the process, staging it under a new path
+    makes sure an updated library replacing the old file is actually loaded.
+    """
+
+    library = "libsensiml.dll" if os.name == "nt" else "libsensiml.so"
+    staging_path = tempfile.mkdtemp(prefix="sml-")
+
+    try:
+        shutil.copy(os.path.join(sml_library_path, library), staging_path)
+    except Exception:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
+    if not _staged_paths:
+        atexit.register(_release_staged_knowledge_packs)
+    _staged_paths.add(staging_path)
+
+    return staging_path
+
+
+def release_knowledge_pack(sml_library_path):
+    """Remove a folder made by stage_knowledge_pack, any other path is left alone"""
+
+    if sml_library_path not in _staged_paths:
+        return
+
+    _staged_paths.discard(sml_library_path)
+    shutil.rmtree(sml_library_path, ignore_errors=True)
+
+
+def _release_staged_knowledge_packs():
+    for sml_library_path in list(_staged_paths):
+        release_knowledge_pack(sml_library_path)
+
+
+class InferencePacket(object):
+    """A packet queued for inference.
+
+    The packet is decoded into the model input array the first time a worker asks for
+    it, every other worker gets the same read-only array.
+    """
+
+    def __init__(self, reader, data, samples=None):
+        self._reader = reader
+        self._data = data
+        self._samples = samples
+        self._batch = None
+        self._lock = threading.Lock()
+
+    @property
+    def batch(self):
+        with self._lock:
+            if self._batch is None:
+                batch = self._reader.convert_data_to_batch(
+                    self._data, samples=self._samples
+                )
+                batch.flags.writeable = False
+                self._batch = batch
+
+            return self._batch
+
+
+class InferenceWorker(object):
+    """Runs a knowledge pack on packets handed over by a source reader thread.
+
+    The reader thread only calls submit, which never blocks. Packets that arrive while
+    the queue is full are dropped and counted, so a slow model can not stall the I/O
+    loop. The knowledge pack is loaded and run on the worker thread, every model index
+    in model_indexes sees each packet, and the classifications are written to the
+    reader's results buffer.
+
+    Each worker must load a different libsensiml file, loading the same file twice
+    shares the knowledge pack state between the workers. BaseReader._start_inference
+    stages a copy for every repeated path.
+    """
+
+    def __init__(
+        self,
+        reader,
+        sml_library_path,
+        model_indexes=(0,),
+        name=None,
+        queue_size=INFERENCE_QUEUE_SIZE,
+    ):
+        self._reader = reader
+        self._sml_library_path = sml_library_path
+        self._model_indexes = list(model_indexes)
+        self._name = name
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._sml = None
+        self._standby = None
+        self._swap_state = None
+        self._swap_error = None
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.classifications = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    @property
+    def name(self):
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        with self._lock:
+            self._name = name
+
+    @property
+    def sml_library_path(self):
+        """path of the knowledge pack the worker runs"""
+        return self._sml_library_path
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+        if self._thread is not None:
+            self._thread.join(INFERENCE_QUEUE_TIMEOUT * 2)
+            self._thread = None
+
+    def submit(self, packet):
+        """Queue an InferencePacket, returns False if it was dropped"""
+
+        try:
+            self._queue.put_nowait(packet)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        return True
+
+    def _load_model(self):
+        return self._reader.get_sml_model_obj(self._sml_library_path)
+
+    def swap_model(self, sml_library_path):
+        """Load a knowledge pack on a background thread and switch to it when ready.
+
+        The running model keeps classifying while the new one loads and is initialized,
+        packets keep queueing, and the switch happens between two packets. Returns the
+        path the knowledge pack is loaded from, the staged copy of its library.
+        """
+
+        with self._lock:
+            if self._swap_state == SWAP_LOADING:
+                raise Exception("A knowledge pack is already being loaded")
+
+            self._swap_state = SWAP_LOADING
+            self._swap_error = None
+
+        try:
+            # the emulator has no library file to stage
+            if not is_emulator_path(sml_library_path):
+                sml_library_path = stage_knowledge_pack(sml_library_path)
+        except Exception as e:
+            with self._lock:
+                self._swap_state = SWAP_FAILED
+                self._swap_error = str(e)
+            raise
+
+        thread = threading.Thread(
+            target=self._load_standby, args=(sml_library_path,), daemon=True
+        )
+        thread.start()
+
+        return sml_library_path
+
+    def _load_standby(self, sml_library_path):
+        try:
+            sml = self._reader.get_sml_model_obj(sml_library_path)
+        except Exception as e:
+            print("InferenceWorker: Failed to load the standby model", e)
+            release_knowledge_pack(sml_library_path)
+            with self._lock:
+                self._swap_state = SWAP_FAILED
+                self._swap_error = str(e)
+            return
+
+        with self._lock:
+            self._standby = (sml_library_path, sml)
+            self._swap_state = SWAP_READY
+
+    def _swap_standby(self):
+        with self._lock:
+            previous = self._sml_library_path
+            self._sml_library_path, self._sml = self._standby
+            self._standby = None
+            self._swap_state = SWAP_DONE
+
+        print("InferenceWorker: Switched to knowledge pack", self._sml_library_path)
+
+        if previous != self._sml_library_path:
+            release_knowledge_pack(previous)
+
+    def _run(self):
+        try:
+            self._sml = self._load_model()
+        except Exception as e:
+            print("InferenceWorker: Failed to load the model", e)
+            self._running = False
+            return
+
+        print("InferenceWorker: Running models", self._name, self._model_indexes)
+
+        try:
+            while self._running:
+                if self._standby is not None:
+                    self._swap_standby()
+
+                try:
+                    packet = self._queue.get(timeout=INFERENCE_QUEUE_TIMEOUT)
+                except queue.Empty:
+                    continue
+
+                try:
+                    self._run_packet(packet)
+                except Exception as e:
+                    # one bad packet must not stop the classifications of the rest
+                    print("InferenceWorker: Failed to run the model", self._name, e)
+                    with self._lock:
+                        self.errors += 1
+        finally:
+            self._running = False
+
+        print("InferenceWorker: Stopped")
+
+    def _run_packet(self, packet):
+        sml = self._sml
+        start = time.perf_counter()
+        results = []
+        for model_index in self._model_indexes:
+            results.extend(
+                self._reader.execute_run_sml_model(
+                    sml,
+                    None,
+                    model_index=model_index,
+                    batch=packet.batch,
+                    knowledge_pack=self._name,
+                )
+            )
+        latency = time.perf_counter() - start
+
+        if results:
+            self._reader.rbuffer.update_buffer(results)
+
+        with self._lock:
+            self.processed += 1
+            self.classifications += len(results)
+            self.last_latency = latency
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                "name": self._name,
+                "sml_library_path": self._sml_library_path,
+                "model_indexes": self._model_indexes,
+                "swap_state": self._swap_state,
+                "swap_error": self._swap_error,
+                "running": self._running,
+                "queue_depth": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "classifications": self.classifications,
+                "last_latency_ms": self.last_latency * 1000.0,
+                "mean_latency_ms": (
+                    self.total_latency * 1000.0 / self.processed
+                    if self.processed
+                    else 0.0
+                ),
+                "max_latency_ms": self.max_latency * 1000.0,
+            }
+
+        if self._sml is not None:
+            stats["knowledge_pack"] = self._sml.get_stats(
+                sample_rate=self._reader.sample_rate
+            )
+
+        return stats
@@ -121,20 +121,12 @@ class MICStreamReader(MICReader, BaseStreamReaderMixin):
 
             data = self._audioStream.read(100)
 
-            if self.run_sml_model:
-                sml = self.get_sml_model_obj()
-            else:
-                sml = None
+            self._start_inference()
 
             while self.streaming:
                 data = self._audioStream.read(self.source_samples_per_packet)
 
-                self.buffer.update_buffer(data)
-
-                if self.run_sml_model:
-                    model_result = self.execute_run_sml_model(sml, data)
-                    if model_result:
-                        self.rbuffer.update_buffer([model_result])
+                self._update_buffers(data)
 
                 time.sleep(0.00001)
 
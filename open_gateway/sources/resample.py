@@ -0,0 +1,320 @@
+import math
+import numpy as np
+
+from open_gateway.sources.base import INT16_MIN, INT16_MAX
+
+# slots after which a slot's weight in the drift fit has halved
+DRIFT_FIT_HALF_LIFE = 512
+# slots and seconds needed before the fitted clock replaces the nominal sample rate
+DRIFT_FIT_MIN_SLOTS = 32
+DRIFT_FIT_MIN_SECONDS = 5.0
+
+
+def promote_data_type(data_types):
+    """data type able to hold every source, float if any source streams floats"""
+    if "float" in data_types:
+        return "float"
+
+    return "int16"
+
+
+def encode_samples(samples, data_type):
+    """Fused (frames, width) float64 array as the packet bytes of data_type"""
+    if data_type == "float":
+        return samples.astype("<f4").tobytes()
+
+    return np.clip(np.rint(samples), INT16_MIN, INT16_MAX).astype("<i2").tobytes()
+
+
+class ClockDriftEstimator(object):
+    """Streaming linear fit of a source's slot arrival times against its sample count.
+
+    Every sealed slot adds the point (index of its last sample, monotonic seal time).
+    The slope of the fit is the period of the device's sample clock as seen by the
+    gateway, so crystals that run fast or slow show up as drift against the nominal
+    sample rate. Older slots are exponentially forgotten so the fit follows drift that
+    changes over a session. Until min_slots slots spanning min_seconds were seen the
+    nominal rate is used, anchored on the first slot, so a burst of slots at the start
+    does not skew the fit.
+
+    The fit includes the transport latency of the source, sources with very different
+    latencies are aligned with that offset.
+    """
+
+    def __init__(
+        self,
+        sample_rate,
+        half_life=DRIFT_FIT_HALF_LIFE,
+        min_slots=DRIFT_FIT_MIN_SLOTS,
+        min_seconds=DRIFT_FIT_MIN_SECONDS,
+    ):
+        self.sample_rate = float(sample_rate)
+        self._decay = 0.5 ** (1.0 / half_life)
+        self._min_slots = min_slots
+        self._min_seconds = min_seconds
+        self.reset()
+
+    def reset(self):
+        # sums of the weighted points, relative to the latest point so they stay small
+        self._origin = None
+        self._s0 = 0.0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+        self._t0 = None
+        self._first_arrival = None
+        self._fit = None
+        self.slots = 0
+
+    @property
+    def started(self):
+        return self._origin is not None
+
+    @property
+    def ready(self):
+        return self._fit is not None
+
+    def add(self, index, arrival):
+        """Add the slot whose last sample, the index-th of the source, arrived at arrival"""
+
+        if self._origin is None:
+            self._t0 = arrival - index / self.sample_rate
+            self._first_arrival = arrival
+        else:
+            dx = index - self._origin[0]
+            dy = arrival - self._origin[1]
+
+            self._sxy += dx * dy * self._s0 - dy * self._sx - dx * self._sy
+            self._sxx += dx * dx * self._s0 - 2 * dx * self._sx
+            self._sx -= dx * self._s0
+            self._sy -= dy * self._s0
+
+        self._origin = (index, arrival)
+        self._s0 = self._s0 * self._decay + 1.0
+        self._sx *= self._decay
+        self._sy *= self._decay
+        self._sxx *= self._decay
+        self._sxy *= self._decay
+        self.slots += 1
+
+        self._update_fit()
+
+    def _update_fit(self):
+        if self.slots < self._min_slots:
+            return
+
+        if self._origin[1] - self._first_arrival < self._min_seconds:
+            return
+
+        determinant = self._s0 * self._sxx - self._sx * self._sx
+        if determinant <= 0:
+            return
+
+        period = (self._s0 * self._sxy - self._sx * self._sy) / determinant
+        if period <= 0:
+            return
+
+        offset = (self._sy - period * self._sx) / self._s0
+        self._fit = (self._origin[0], self._origin[1] + offset, period)
+
+    @property
+    def period(self):
+        if self._fit is None:
+            return 1.0 / self.sample_rate
+
+        return self._fit[2]
+
+    @property
+    def estimated_sample_rate(self):
+        return 1.0 / self.period
+
+    def time(self, index):
+        """monotonic time the index-th sample of the source was taken"""
+        if self._fit is None:
+            return self._t0 + index / self.sample_rate
+
+        origin, origin_time, period = self._fit
+
+        return origin_time + (index - origin) * period
+
+    def index(self, timestamp):
+        """fractional index of the sample taken at the monotonic timestamp"""
+        if self._fit is None:
+            return (timestamp - self._t0) * self.sample_rate
+
+        origin, origin_time, period = self._fit
+
+        return origin + (timestamp - origin_time) / period
+
+    def get_stats(self):
+        return {
+            "fit_slots": self.slots,
+            "fitted": self.ready,
+            "estimated_sample_rate": self.estimated_sample_rate,
+            "drift_ppm": (self.estimated_sample_rate / self.sample_rate - 1.0) * 1e6,
+        }
+
+
+class SourceResampler(object):
+    """Puts the samples of one fused source on the timeline of the fused stream.
+
+    Sample i of the source is placed on the timeline by a ClockDriftEstimator fitted
+    to the times its slots were sealed, so a device clock drifting from its nominal
+    rate stays aligned. Once the fit is ready every slot is compared against the time
+    it expected the slot, the difference is reported as the source's jitter.
+
+    The output frames are linearly interpolated between the neighbouring samples.
+    Sources faster than the output rate are first averaged over a window of
+    sample_rate / output_rate samples so decimating them does not alias.
+    """
+
+    def __init__(self, sample_rate, data_width, output_rate):
+        self.sample_rate = float(sample_rate)
+        self.data_width = data_width
+        self.output_rate = float(output_rate)
+        self.window = max(int(round(self.sample_rate / self.output_rate)), 1)
+
+        self._pending = np.empty((0, data_width), dtype=np.float64)
+        self._first_index = 0
+        self._sequence = None
+        self.clock = ClockDriftEstimator(sample_rate)
+
+        self.samples = 0
+        self.packets = 0
+        self.resyncs = 0
+        self._jitter_count = 0
+        self._jitter_mean = 0.0
+        self._jitter_m2 = 0.0
+        self._jitter_max = 0.0
+
+    @property
+    def started(self):
+        return self.clock.started and len(self._pending) >= self.window
+
+    def _sample_time(self, index):
+        return self.clock.time(index)
+
+    @property
+    def _filter_delay(self):
+        """samples between the start of an averaging window and the time it stands for"""
+        return (self.window - 1) / 2.0
+
+    @property
+    def start_time(self):
+        return self._sample_time(self._first_index + self._filter_delay)
+
+    @property
+    def end_time(self):
+        last = self._first_index + len(self._pending) - 1 - self._filter_delay
+        return self._sample_time(last)
+
+    def covers(self, timestamp):
+        """True once the source has samples up to timestamp"""
+        if not self.started:
+            return False
+
+        return timestamp is None or self.end_time >= timestamp
+
+    def resync(self):
+        """Drop the pending samples, the next slot starts a new timeline"""
+        self._pending = self._pending[:0]
+        self._first_index = 0
+        self._sequence = None
+        self.clock.reset()
+        self.resyncs += 1
+
+    def _record_jitter(self, jitter):
+        self._jitter_count += 1
+        delta = jitter - self._jitter_mean
+        self._jitter_mean += delta / self._jitter_count
+        self._jitter_m2 += delta * (jitter - self._jitter_mean)
+        self._jitter_max = max(self._jitter_max, abs(jitter))
+
+    def add(self, samples, sealed_at, sequence=None):
+        """Append the (samples, data_width) slot sealed at the monotonic time sealed_at.
+
+        sequence is the slot's running number in the source buffer, a gap means slots
+        were skipped and the timeline is started again.
+        """
+
+        if (
+            sequence is not None
+            and self._sequence is not None
+            and sequence != self._sequence + 1
+        ):
+            self.resync()
+
+        self._sequence = sequence
+        count = len(samples)
+        last_index = self._first_index + len(self._pending) + count - 1
+
+        if self.clock.ready:
+            # the residual against the fitted clock, drift is reported on its own
+            self._record_jitter(sealed_at - self._sample_time(last_index))
+
+        self.clock.add(last_index, sealed_at)
+
+        self._pending = np.concatenate(
+            (self._pending, np.asarray(samples, dtype=np.float64))
+        )
+        self.samples += count
+        self.packets += 1
+
+    def _filtered(self):
+        if self.window == 1:
+            return self._pending
+
+        cumulative = np.cumsum(self._pending, axis=0)
+        cumulative = np.concatenate(
+            (np.zeros((1, self.data_width), dtype=np.float64), cumulative)
+        )
+
+        return (cumulative[self.window :] - cumulative[: -self.window]) / self.window
+
+    def resample(self, times):
+        """The source at each of the monotonic times, as a (len(times), data_width) array.
+
+        Samples before the earliest of the times are dropped afterwards.
+        """
+
+        filtered = self._filtered()
+        last = len(filtered) - 1
+
+        position = self.clock.index(times)
+        position -= self._first_index + self._filter_delay
+        np.clip(position, 0, last, out=position)
+
+        lower = np.minimum(np.floor(position).astype(np.intp), max(last - 1, 0))
+        upper = np.minimum(lower + 1, last)
+        fraction = (position - lower)[:, np.newaxis]
+
+        frames = filtered[lower] * (1.0 - fraction) + filtered[upper] * fraction
+
+        consumed = int(lower[-1]) if len(lower) else 0
+        self._pending = self._pending[consumed:]
+        self._first_index += consumed
+
+        return frames
+
+    def get_stats(self):
+        variance = (
+            self._jitter_m2 / (self._jitter_count - 1)
+            if self._jitter_count > 1
+            else 0.0
+        )
+
+        stats = {
+            "sample_rate": self.sample_rate,
+            "window": self.window,
+            "samples": self.samples,
+            "packets": self.packets,
+            "pending_samples": len(self._pending),
+            "resyncs": self.resyncs,
+            "jitter_mean_ms": self._jitter_mean * 1000.0,
+            "jitter_std_ms": math.sqrt(variance) * 1000.0,
+            "jitter_max_ms": self._jitter_max * 1000.0,
+        }
+        stats.update(self.clock.get_stats())
+
+        return stats
@@ -169,10 +169,7 @@ class SerialStreamReader(SerialReader, BaseStreamReaderMixin):
                 ser.reset_input_buffer()
                 ser.read(self.source_buffer_size)
 
-                if self.run_sml_model:
-                    sml = self.get_sml_model_obj()
-                else:
-                    sml = None
+                self._start_inference()
 
                 if self.streaming_version == 1:
                     pass
@@ -181,12 +178,7 @@ class SerialStreamReader(SerialReader, BaseStreamReaderMixin):
 
                 while self.streaming:
                     data = self._read_serial_data(ser)
-                    self.buffer.update_buffer(data)
-
-                    if self.run_sml_model:
-                        model_result = self.execute_run_sml_model(sml, data)
-                        if model_result:
-                            self.rbuffer.update_buffer([model_result])
+                    self._update_buffers(data)
 
                     time.sleep(0.00001)
 
@@ -54,22 +54,14 @@ class TCPIPStreamReader(TCPIPReader, BaseStreamReaderMixin):
 
             self.streaming = True
 
-            if self.run_sml_model:
-                sml = self.get_sml_model_obj()
-            else:
-                sml = None
+            self._start_inference()
 
             with s.get(url, headers=None, stream=True) as resp:
                 for data in resp.iter_content(chunk_size=self.source_buffer_size):
                     if not self.streaming:
                         return
 
-                    self.buffer.update_buffer(data)
-
-                    if self.run_sml_model:
-                        model_result = self.execute_run_sml_model(sml, data)
-                        if model_result:
-                            self.rbuffer.update_buffer([model_result])
+                    self._update_buffers(data)
 
                     time.sleep(0.0001)
 
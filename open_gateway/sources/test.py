@@ -95,10 +95,7 @@ class TestStreamReader(TestReader, BaseStreamReaderMixin):
 
         self.streaming = True
 
-        if self.run_sml_model:
-            sml = self.get_sml_model_obj()
-        else:
-            sml = None
+        self._start_inference()
 
         sleep_time = self.source_samples_per_packet / float(self.sample_rate)
         while self.streaming:
@@ -113,10 +110,7 @@ class TestStreamReader(TestReader, BaseStreamReaderMixin):
                     index,
                 )
 
-                self.buffer.update_buffer(sample_data)
-
-                if self.run_sml_model:
-                    self.execute_run_sml_model(sml, sample_data)
+                self._update_buffers(sample_data)
 
             except Exception as e:
                 self.disconnect()
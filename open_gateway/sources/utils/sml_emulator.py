@@ -0,0 +1,254 @@
+import time
+import numpy as np
+
+from open_gateway.sources.utils.sml_runner import SMLRunner
+
+EMULATOR_PREFIX = "emulator:"
+
+EMULATOR_SEGMENT_LENGTH = 100
+EMULATOR_CLASS_PATTERN = (1, 2, 3)
+EMULATOR_FEATURE_LENGTH = 16
+
+
+def is_emulator_path(sml_library_path):
+    return isinstance(sml_library_path, str) and sml_library_path.startswith(
+        EMULATOR_PREFIX
+    )
+
+
+def parse_emulator_options(sml_library_path):
+    """Options of an emulator path as a dict.
+
+    The path is "emulator:" followed by ";" separated key=value pairs, for example
+    "emulator:segment_length=50;segment_cost_us=200;pattern=1,2,2,3".
+    """
+
+    options = {}
+    for option in sml_library_path[len(EMULATOR_PREFIX) :].split(";"):
+        if not option.strip():
+            continue
+
+        if "=" not in option:
+            raise Exception("Invalid emulator option {}".format(option))
+
+        key, value = [x.strip() for x in option.split("=", 1)]
+
+        if key == "pattern":
+            options["class_pattern"] = [int(x) for x in value.split(",")]
+        elif key in ("segment_length", "feature_length"):
+            options[key] = int(value)
+        elif key in ("sample_cost_us", "segment_cost_us"):
+            options[key] = float(value)
+        elif key == "sleep":
+            options[key] = value.lower() in ("1", "true", "yes")
+        else:
+            raise Exception("Unknown emulator option {}".format(key))
+
+    return options
+
+
+class SMLEmulator(SMLRunner):
+    """Pure Python stand-in for a knowledge pack, for benchmarking the inference path.
+
+    A segment is classified every segment_length samples, the classifications cycle
+    through class_pattern. sample_cost_us and segment_cost_us add the time a real model
+    spends per sample and per classified segment, the time is spun on the calling thread
+    or, with sleep, slept like a library call that releases the GIL.
+
+    Supports the SMLRunner calls used by the gateway, no library is loaded.
+    """
+
+    def __init__(
+        self,
+        segment_length=EMULATOR_SEGMENT_LENGTH,
+        class_pattern=EMULATOR_CLASS_PATTERN,
+        sample_cost_us=0.0,
+        segment_cost_us=0.0,
+        feature_length=EMULATOR_FEATURE_LENGTH,
+        sleep=False,
+        instrument=False,
+    ):
+        if segment_length < 1:
+            raise Exception("segment_length must be at least 1")
+
+        if not class_pattern:
+            raise Exception("class_pattern must have at least one class")
+
+        self._path = None
+        self._model_initialized = False
+        self._run_type = None
+        self._instrument = instrument
+        self._scratch = {}
+
+        self.segment_length = segment_length
+        self.class_pattern = list(class_pattern)
+        self.sample_cost = sample_cost_us / 1e6
+        self.segment_cost = segment_cost_us / 1e6
+        self.feature_length = feature_length
+        self.sleep = sleep
+
+        self._models = {}
+
+        self.reset_stats()
+
+    @classmethod
+    def from_path(cls, sml_library_path, instrument=False):
+        return cls(instrument=instrument, **parse_emulator_options(sml_library_path))
+
+    def _model(self, model_index):
+        model = self._models.get(model_index)
+        if model is None:
+            model = {
+                "count": 0,
+                "classified": 0,
+                "last": -1,
+                "feature_vector": [],
+            }
+            self._models[model_index] = model
+
+        return model
+
+    def _spend(self, seconds):
+        if seconds <= 0:
+            return
+
+        if self.sleep:
+            time.sleep(seconds)
+            return
+
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+
+    def _classify(self, model, segment):
+        """Classify the rows of segment, only the rows seen in the last call are kept"""
+        self._spend(self.segment_cost)
+
+        ret = self.class_pattern[model["classified"] % len(self.class_pattern)]
+        model["classified"] += 1
+        model["last"] = ret
+
+        if len(segment):
+            means = np.abs(np.asarray(segment, dtype=np.float64)).mean(axis=0)
+            features = np.resize(means.astype(np.int64) & 0xFF, self.feature_length)
+            model["feature_vector"] = features.astype(np.uint8).tolist()
+
+        return ret
+
+    def _model_init(self):
+        self._models = {}
+
+    def flush_model_buffer(self, model_index):
+        if not self._initialized():
+            return
+
+        self._model(model_index)["count"] = 0
+
+    def reset_model(self, model_index):
+        self._reset_model(model_index)
+
+    def run_model(self, data, model_index):
+        if not self._initialized():
+            print("Knowledge Pack model is not initialized.")
+            return
+        elif self._run_with("run_model") is False:
+            print("Model already run with run segment")
+            return
+
+        start = time.perf_counter_ns()
+        self._spend(self.sample_cost)
+
+        model = self._model(model_index)
+        model["count"] += 1
+
+        ret = -1
+        if model["count"] >= self.segment_length:
+            ret = self._classify(model, np.reshape(data, (1, -1)))
+
+        if self._instrument:
+            self._record("run_model", time.perf_counter_ns() - start, ret)
+
+        return ret
+
+    def _row_runner(self, data_batch, model_index):
+        """Runs the rows of data_batch for the batch loop of SMLRunner.run_model_batch"""
+        model = self._model(model_index)
+
+        def run_row(row):
+            self._spend(self.sample_cost)
+            model["count"] += 1
+
+            if model["count"] < self.segment_length:
+                return -1
+
+            return self._classify(
+                model, data_batch[max(row + 1 - self.segment_length, 0) : row + 1]
+            )
+
+        return run_row
+
+    def _reset_model(self, model_index):
+        self._model(model_index)["count"] = 0
+
+    def run_segment(self, data_segment, model_index, debug_log=False):
+        if not self._initialized():
+            return
+
+        if self._run_with("run_segment") is False:
+            return
+
+        data = np.asarray(data_segment)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+
+        start = time.perf_counter_ns()
+        self._spend(self.sample_cost * len(data))
+        ret = self._classify(self._model(model_index), data)
+
+        if self._instrument:
+            self._record("run_segment", time.perf_counter_ns() - start, ret)
+
+        return ret
+
+    def get_feature_vector(self, model_index, feature_vector_buffer_size=256):
+        if not self._initialized():
+            return
+
+        return list(self._model(model_index)["feature_vector"])[
+            :feature_vector_buffer_size
+        ]
+
+    def set_feature_vector(self, model_index, feature_vector):
+        if not self._initialized():
+            return
+
+        self._model(model_index)["feature_vector"] = [int(x) for x in feature_vector]
+
+        return 0
+
+    def recognize_feature_vector(self, model_index):
+        if not self._initialized():
+            return
+
+        start = time.perf_counter_ns()
+        ret = self._classify(self._model(model_index), [])
+
+        if self._instrument:
+            self._record(
+                "recognize_feature_vector", time.perf_counter_ns() - start, ret
+            )
+
+        return ret
+
+    def get_model_result_outputs(self, model_index):
+        """one hot output tensor over the classes of the pattern"""
+
+        if not self._initialized():
+            return []
+
+        outputs = [0.0] * (max(self.class_pattern) + 1)
+        last = self._model(model_index)["last"]
+        if last >= 0:
+            outputs[last] = 1.0
+
+        return outputs
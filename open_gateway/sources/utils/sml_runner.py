@@ -1,7 +1,15 @@
 import os
 import json
+import time
 import ctypes
 from ctypes import Array, CDLL
+import numpy as np
+
+try:
+    from pandas import DataFrame, Series
+except ImportError:
+    DataFrame = None
+    Series = None
 
 if os.name == "nt":
     from ctypes import WinDLL
@@ -102,6 +110,65 @@ class Model(object):
         self.feature_summary = [{"Feature": str(x)} for x in range(len(feature_vector))]
 
 
+LATENCY_HISTOGRAM_BUCKETS = 40
+MAX_OUTPUT_TENSOR_SIZE = 128
+
+
+class LatencyHistogram(object):
+    """Fixed size histogram of call durations in nanoseconds.
+
+    Bucket i counts the durations in [2**(i-1), 2**i) ns, the last bucket also holds
+    anything longer, so recording never allocates.
+    """
+
+    def __init__(self, num_buckets=LATENCY_HISTOGRAM_BUCKETS):
+        self._buckets = [0] * num_buckets
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+
+    def record(self, duration_ns):
+        self._buckets[min(duration_ns.bit_length(), len(self._buckets) - 1)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        self.max_ns = max(self.max_ns, duration_ns)
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+
+    def percentile(self, percent):
+        """upper bound in ns of the bucket holding the percentile"""
+        if not self.count:
+            return None
+
+        target = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if seen >= target:
+                return min(2**index, self.max_ns)
+
+        return self.max_ns
+
+    def to_dict(self):
+        buckets = list(self._buckets)
+
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000.0 if self.count else None,
+            "min_us": self.min_ns / 1000.0 if self.min_ns is not None else None,
+            "max_us": self.max_ns / 1000.0,
+            "p50_us": (self.percentile(50) / 1000.0 if self.count else None),
+            "p99_us": (self.percentile(99) / 1000.0 if self.count else None),
+            # upper bound of each non empty bucket in us and its count
+            "histogram": [
+                [2**index / 1000.0, count]
+                for index, count in enumerate(buckets)
+                if count
+            ],
+        }
+
+
 class SMLRunner(object):
     """
     This class provides a python interface to the knowledgpack libary generated by SensiML.
@@ -131,9 +198,13 @@ class SMLRunner(object):
 
     """
 
-    def __init__(self, path):
+    def __init__(self, path, instrument=False):
         self._run_type = None
         self._model_initialized = False
+        self._scratch = {}
+        self._output_tensor = (ctypes.c_float * MAX_OUTPUT_TENSOR_SIZE)()
+        self._instrument = instrument
+        self.reset_stats()
 
         if os.name == "nt":
             print("loading dll")
@@ -166,6 +237,15 @@ class SMLRunner(object):
         ]
         self._run_model.restype = ctypes.c_int
 
+        # same entry point taking a raw address, so batches can pass row pointers as ints
+        self._run_model_address = clf_lib["kb_run_model"]
+        self._run_model_address.argtypes = [
+            ctypes.c_void_p,
+            ctypes.c_int,
+            ctypes.c_int,
+        ]
+        self._run_model_address.restype = ctypes.c_int
+
         self._run_segment = clf_lib.kb_run_segment
         self._run_segment.argtypes = [ctypes.c_int]
         self._run_segment.restype = ctypes.c_int
@@ -299,7 +379,9 @@ class SMLRunner(object):
             ]
             self._classification_result_info.restype = ctypes.c_int
         except:
-            self._classification_result_info = empty_function
+            # checked on every classification when features are captured, so missing
+            # support is resolved here once instead of printing per call
+            self._classification_result_info = None
 
     def _initialized(self):
         if not self._model_initialized:
@@ -366,13 +448,15 @@ class SMLRunner(object):
         category_ctype = ctypes.c_uint16(category)
         aif_ctype = ctypes.c_uint16(aif)
 
-        feature_vector_array = (ctypes.c_uint8 * len(feature_vector))()
-
-        for index, value in enumerate(feature_vector):
-            feature_vector_array[index] = ctypes.c_uint8(value)
+        feature_vector_array = self._as_contiguous(
+            "feature_vector", feature_vector, np.uint8
+        )
 
         return self._add_custom_pattern_to_model(
-            model_index_ctype, feature_vector_array, category_ctype, aif_ctype
+            model_index_ctype,
+            feature_vector_array.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
+            category_ctype,
+            aif_ctype,
         )
 
     def add_last_pattern_to_model(self, model_index, category, aif):
@@ -488,10 +572,166 @@ class SMLRunner(object):
         for index, value in enumerate(data):
             data_array[index] = ctypes.c_int16(int(value))
 
-        ret = self._run_model(data_array, nsensors_ctype, model_index_ctype)
+        if self._instrument:
+            start = time.perf_counter_ns()
+            ret = self._run_model(data_array, nsensors_ctype, model_index_ctype)
+            self._record("run_model", time.perf_counter_ns() - start, ret)
+        else:
+            ret = self._run_model(data_array, nsensors_ctype, model_index_ctype)
 
         return ret
 
+    def reset_stats(self):
+        self._latency = {
+            "run_model": LatencyHistogram(),
+            "run_segment": LatencyHistogram(),
+            "recognize_feature_vector": LatencyHistogram(),
+        }
+        self._segments = 0
+        self._classifications = 0
+        self._stats_started = None
+
+    def _record(self, name, duration_ns, ret):
+        """Add a timed call to the stats, ret >= 0 means a segment was classified"""
+        if self._stats_started is None:
+            self._stats_started = time.perf_counter() - duration_ns / 1e9
+
+        self._latency[name].record(duration_ns)
+
+        if ret is not None and ret >= 0:
+            if name != "recognize_feature_vector":
+                self._segments += 1
+            self._classifications += 1
+
+    def get_stats(self, sample_rate=None):
+        """
+        Timing of the knowledge pack calls, only collected when created with instrument.
+
+        With the sample_rate of the stream the share of each sample period spent in
+        run_model is reported as sample_time_fraction.
+        """
+        elapsed = (
+            time.perf_counter() - self._stats_started
+            if self._stats_started is not None
+            else 0
+        )
+        run_model = self._latency["run_model"]
+
+        stats = {
+            "instrumented": self._instrument,
+            "segments": self._segments,
+            "classifications": self._classifications,
+            "classifications_per_second": (
+                self._classifications / elapsed if elapsed else 0.0
+            ),
+            "sample_time_fraction": None,
+        }
+
+        for name, histogram in self._latency.items():
+            stats[name] = histogram.to_dict()
+
+        if sample_rate and run_model.count:
+            stats["sample_time_fraction"] = (
+                run_model.total_ns / run_model.count / 1e9 * float(sample_rate)
+            )
+
+        return stats
+
+    def _as_contiguous(self, name, values, dtype):
+        """
+        values as a C-contiguous array of dtype that can be handed to the knowledge pack.
+
+        Arrays that already match are used in place, anything else is converted into a
+        scratch buffer that is kept and reused by the next call with the same name.
+        """
+        if (
+            isinstance(values, np.ndarray)
+            and values.dtype == dtype
+            and values.flags.c_contiguous
+        ):
+            return values
+
+        shape = np.shape(values)
+        size = int(np.prod(shape))
+
+        scratch = self._scratch.get(name)
+        if scratch is None or scratch.size < size:
+            scratch = np.empty(size, dtype=dtype)
+            self._scratch[name] = scratch
+
+        array = scratch[:size].reshape(shape)
+        array[...] = values
+
+        return array
+
+    def _row_runner(self, data_batch, model_index):
+        """
+        Returns a callable that runs the model on one row of data_batch, by row index.
+
+        Each row is passed to the knowledge pack by address, so no ctypes objects are
+        created per sample. C-contiguous int16 arrays are read in place, anything else is
+        copied once into a preallocated buffer.
+        """
+        data_batch = self._as_contiguous("batch", data_batch, np.int16)
+        address = data_batch.ctypes.data
+        row_size = data_batch.shape[1] * ctypes.sizeof(ctypes.c_int16)
+        run_model = self._run_model_address
+
+        def run_row(row):
+            return run_model(address + row * row_size, 0, model_index)
+
+        return run_row
+
+    def run_model_batch(
+        self, data_batch, model_index, reset=True, on_classification=None
+    ):
+        """
+        Runs run_model over every row of a 2d array of (samples, sensors) int16 values.
+
+        Each row is run by the callable from _row_runner, see there for how the rows are
+        handed to the knowledge pack.
+
+        Args:
+            data_batch(ndarray): timepoints of data, one row per sample
+            model_index(int): Index of the model to run
+            reset(bool): reset the model after each classification so the remaining
+                samples keep being classified
+            on_classification(callable): called with (row, classification) right after
+                each classification, before the model is reset, so the feature vector
+                and result details can still be read
+
+         Returns:
+             list of (row, classification) for every classification in the batch, where
+                 row is the index of the sample that completed the segment.
+        """
+        if not self._initialized():
+            print("Knowledge Pack model is not initialized.")
+            return []
+        elif self._run_with("run_model") is False:
+            print("Model already run with run segment")
+            return []
+
+        rows = len(data_batch)
+        run_row = self._row_runner(data_batch, model_index)
+
+        results = []
+        for row in range(rows):
+            if self._instrument:
+                start = time.perf_counter_ns()
+                ret = run_row(row)
+                self._record("run_model", time.perf_counter_ns() - start, ret)
+            else:
+                ret = run_row(row)
+
+            if ret >= 0:
+                results.append((row, ret))
+                if on_classification is not None:
+                    on_classification(row, ret)
+                if reset:
+                    self._reset_model(model_index)
+
+        return results
+
     def run_segment(self, data_segment, model_index, debug_log=False):
         """
         Add a segment of data to the model as input. Then runs the model on the current segment, skipping the data streaming steps.
@@ -514,28 +754,39 @@ class SMLRunner(object):
         if self._run_with("run_segment") is False:
             return
 
-        if isinstance(data_segment, (DataFrame, Series)):
+        if DataFrame is not None and isinstance(data_segment, (DataFrame, Series)):
             data = data_segment.values
-        elif isinstance(data_segment, ndarray):
+        elif isinstance(data_segment, np.ndarray):
             data = data_segment
         else:
             print("Input data Must be either dataframe or array.")
             return
 
-        data_array = (ctypes.c_int16 * (data.shape[0] * data.shape[1]))()
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+
+        # the knowledge pack takes one column after the other, a column-major int16
+        # array already has that layout and is passed without copying
+        data_array = self._as_contiguous("segment", data.T, np.int16)
         length_ctype = ctypes.c_int(data.shape[0])
         nbuffs = ctypes.c_int(data.shape[1])
         model_index_ctype = ctypes.c_int(model_index)
 
-        for col in range(data.shape[1]):
-            for index, value in enumerate(data[:, col]):
-                data_array[col * data.shape[0] + index] = ctypes.c_int16(value)
-
-        self._add_segment(data_array, length_ctype, nbuffs, model_index_ctype)
+        self._add_segment(
+            data_array.ctypes.data_as(ctypes.POINTER(ctypes.c_int16)),
+            length_ctype,
+            nbuffs,
+            model_index_ctype,
+        )
 
         model_index_ctype = ctypes.c_int(model_index)
 
-        ret = self._run_segment(model_index_ctype)
+        if self._instrument:
+            start = time.perf_counter_ns()
+            ret = self._run_segment(model_index_ctype)
+            self._record("run_segment", time.perf_counter_ns() - start, ret)
+        else:
+            ret = self._run_segment(model_index_ctype)
 
         return ret
 
@@ -619,12 +870,14 @@ class SMLRunner(object):
             return
 
         model_index_ctype = ctypes.c_int(model_index)
-        feature_vector_array = (ctypes.c_ubyte * len(feature_vector))()
-
-        for index, value in enumerate(feature_vector):
-            feature_vector_array[index] = ctypes.c_ubyte(value)
+        feature_vector_array = self._as_contiguous(
+            "feature_vector", feature_vector, np.uint8
+        )
 
-        return self._set_feature_vector(model_index_ctype, feature_vector_array)
+        return self._set_feature_vector(
+            model_index_ctype,
+            feature_vector_array.ctypes.data_as(ctypes.POINTER(ctypes.c_ubyte)),
+        )
 
     def recognize_feature_vector(self, model_index):
         """
@@ -636,6 +889,14 @@ class SMLRunner(object):
 
         model_index_ctype = ctypes.c_int(model_index)
 
+        if self._instrument:
+            start = time.perf_counter_ns()
+            ret = self._recognize_feature_vector(model_index_ctype)
+            self._record(
+                "recognize_feature_vector", time.perf_counter_ns() - start, ret
+            )
+            return ret
+
         return self._recognize_feature_vector(model_index_ctype)
 
     def get_model_result_detail_view(self, model_index):
@@ -646,15 +907,35 @@ class SMLRunner(object):
         if not self._initialized():
             return
 
+        if self._classification_result_info is None:
+            return
+
         model_index_ctype = ctypes.c_int(model_index)
         model_result = struct_tf_micro_model_result()
-        output_tensor = (ctypes.c_float * 128)()
-        model_result.output_tensor = ctypes.POINTER(output_tensor)
+        # the output tensor lives on the runner so the pointer stays valid after return,
+        # it is overwritten by the next call
+        model_result.output_tensor = ctypes.cast(
+            self._output_tensor, ctypes.POINTER(ctypes.c_float)
+        )
 
         self._classification_result_info(model_index_ctype, model_result)
 
         return model_result
 
+    def get_model_result_outputs(self, model_index):
+        """
+        output tensor of the last classification as a list of floats
+        """
+
+        model_result = self.get_model_result_detail_view(model_index)
+
+        if model_result is None:
+            return []
+
+        num_outputs = min(model_result.num_outputs, MAX_OUTPUT_TENSOR_SIZE)
+
+        return list(self._output_tensor[:num_outputs])
+
 
 def _color(val):
     color = "white"
@@ -27,5 +27,10 @@ setup(
         "nest_asyncio>=0.11.0",
         "requests",
     ],
-    entry_points={"console_scripts": ["realpython=open_gateway.__main__:app"]},
+    entry_points={
+        "console_scripts": [
+            "realpython=open_gateway.__main__:app",
+            "open-gateway-batch=open_gateway.batch:main",
+        ]
+    },
 )